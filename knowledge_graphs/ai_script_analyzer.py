@@ -18,7 +18,7 @@ from dataclasses import dataclass, field
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+@dataclass(slots=True)
 class ImportInfo:
     """Information about an import statement"""
     module: str
@@ -28,7 +28,7 @@ class ImportInfo:
     line_number: int = 0
 
 
-@dataclass
+@dataclass(slots=True)
 class MethodCall:
     """Information about a method call"""
     object_name: str
@@ -39,7 +39,7 @@ class MethodCall:
     object_type: Optional[str] = None  # Inferred class type
 
 
-@dataclass
+@dataclass(slots=True)
 class AttributeAccess:
     """Information about attribute access"""
     object_name: str
@@ -48,7 +48,7 @@ class AttributeAccess:
     object_type: Optional[str] = None  # Inferred class type
 
 
-@dataclass
+@dataclass(slots=True)
 class FunctionCall:
     """Information about a function call"""
     function_name: str
@@ -58,7 +58,7 @@ class FunctionCall:
     full_name: Optional[str] = None  # Module.function_name
 
 
-@dataclass
+@dataclass(slots=True)
 class ClassInstantiation:
     """Information about class instantiation"""
     variable_name: str
@@ -364,8 +364,11 @@ class HallucinationReporter:
     
     def save_json_report(self, report: Dict[str, Any], output_path: str):
         """Save report as JSON file"""
+        # Serialize up front so the report hits the file in a single write
+        # instead of one small write per JSON token
+        payload = json.dumps(report, indent=2, ensure_ascii=False)
         with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(report, f, indent=2, ensure_ascii=False)
+            f.write(payload)
         
         logger.info(f"JSON report saved to: {output_path}")
     
@@ -14,11 +14,12 @@ Bypasses all LLM processing for maximum speed.
 import asyncio
 import logging
 import os
+import re
 import subprocess
 import shutil
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import List, Optional, Dict, Any, Set
+from typing import List, Optional, Dict, Any, Set, Tuple
 import ast
 
 from dotenv import load_dotenv
@@ -32,6 +33,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Last path segment of a repository URL, without a trailing ".git" or slash.
+# Works for https://host/user/repo(.git) and git@host:user/repo(.git) forms.
+REPO_NAME_PATTERN = re.compile(r'([^/:]+?)(?:\.git)?/*$')
+
+
+def get_repo_name(repo_url: str) -> str:
+    """Extract the repository name from a repository URL."""
+    match = REPO_NAME_PATTERN.search(repo_url.strip())
+    return match.group(1) if match else repo_url
+
 
 class Neo4jCodeAnalyzer:
     """Analyzes code for direct Neo4j insertion"""
@@ -77,6 +88,9 @@ class Neo4jCodeAnalyzer:
             functions = []
             imports = []
             
+            # Prefix tuple for a single startswith() check per import
+            project_prefixes = tuple(project_modules)
+            
             for node in ast.walk(tree):
                 if isinstance(node, ast.ClassDef):
                     # Extract class with its methods and attributes
@@ -165,10 +179,10 @@ class Neo4jCodeAnalyzer:
                     # Track internal imports only
                     if isinstance(node, ast.Import):
                         for alias in node.names:
-                            if self._is_likely_internal(alias.name, project_modules):
+                            if self._is_likely_internal(alias.name, project_prefixes):
                                 imports.append(alias.name)
                     elif isinstance(node, ast.ImportFrom) and node.module:
-                        if (node.module.startswith('.') or self._is_likely_internal(node.module, project_modules)):
+                        if (node.module.startswith('.') or self._is_likely_internal(node.module, project_prefixes)):
                             imports.append(node.module)
             
             return {
@@ -184,7 +198,7 @@ class Neo4jCodeAnalyzer:
             logger.warning(f"Could not analyze {file_path}: {e}")
             return None
     
-    def _is_likely_internal(self, import_name: str, project_modules: Set[str]) -> bool:
+    def _is_likely_internal(self, import_name: str, project_prefixes: Tuple[str, ...]) -> bool:
         """Check if an import is likely internal to the project"""
         if not import_name:
             return False
@@ -199,12 +213,12 @@ class Neo4jCodeAnalyzer:
             return False
         
         # Check if it matches any project module
-        for project_module in project_modules:
-            if import_name.startswith(project_module):
-                return True
+        if import_name.startswith(project_prefixes):
+            return True
         
         # If it's not obviously external, consider it internal
-        if (not any(ext in base_module.lower() for ext in ['test', 'mock', 'fake']) and
+        base_module_lower = base_module.lower()
+        if (not any(ext in base_module_lower for ext in ('test', 'mock', 'fake')) and
             not base_module.startswith('_') and
             len(base_module) > 2):
             return True
@@ -518,17 +532,18 @@ class DirectNeo4jExtractor:
             dirs[:] = [d for d in dirs if d not in exclude_dirs and not d.startswith('.')]
             
             for file in files:
-                if file.endswith('.py') and not file.startswith('test_'):
-                    file_path = Path(root) / file
-                    if (file_path.stat().st_size < 500_000 and 
-                        file not in ['setup.py', 'conftest.py']):
-                        python_files.append(file_path)
+                if (file.endswith('.py') and not file.startswith('test_') and
+                        file not in ('setup.py', 'conftest.py')):
+                    # Stat the plain string path; only build a Path for files we keep
+                    file_path = os.path.join(root, file)
+                    if os.stat(file_path).st_size < 500_000:
+                        python_files.append(Path(file_path))
         
         return python_files
     
     async def analyze_repository(self, repo_url: str, temp_dir: str = None):
         """Analyze repository and create nodes/relationships in Neo4j"""
-        repo_name = repo_url.split('/')[-1].replace('.git', '')
+        repo_name = get_repo_name(repo_url)
         logger.info(f"Analyzing repository: {repo_name}")
         
         # Clear existing data for this repository before re-processing
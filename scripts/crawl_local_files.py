@@ -38,25 +38,27 @@ def smart_chunk_markdown(text: str, chunk_size: int = 5000) -> list:
             chunks.append(text[start:].strip())
             break
 
+        # Break points are searched within text[start:end] by offset, so the
+        # window is never copied out of the text
+        min_break = chunk_size * 0.3
+
         # Try to find a code block boundary first (```)
-        chunk = text[start:end]
-        code_block = chunk.rfind('```')
-        if code_block != -1 and code_block > chunk_size * 0.3:
-            end = start + code_block
+        code_block = text.rfind('```', start, end)
+        if code_block != -1 and code_block - start > min_break:
+            end = code_block
 
-        # If no code block, try to break at a paragraph
-        elif '\n\n' in chunk:
-            # Find the last paragraph break
-            last_break = chunk.rfind('\n\n')
-            if last_break > chunk_size * 0.3:  # Only break if we're past 30% of chunk_size
-                end = start + last_break
+        else:
+            # If no code block, try to break at the last paragraph
+            last_break = text.rfind('\n\n', start, end)
+            if last_break != -1:
+                if last_break - start > min_break:  # Only break if we're past 30% of chunk_size
+                    end = last_break
 
-        # If no paragraph break, try to break at a sentence
-        elif '. ' in chunk:
-            # Find the last sentence break
-            last_period = chunk.rfind('. ')
-            if last_period > chunk_size * 0.3:  # Only break if we're past 30% of chunk_size
-                end = start + last_period + 1
+            # If no paragraph break, try to break at the last sentence
+            else:
+                last_period = text.rfind('. ', start, end)
+                if last_period != -1 and last_period - start > min_break:
+                    end = last_period + 1
 
         # Extract chunk and clean it up
         chunk = text[start:end].strip()
@@ -68,10 +70,13 @@ def smart_chunk_markdown(text: str, chunk_size: int = 5000) -> list:
 
     return chunks
 
+# Markdown ATX headers, matched line by line
+HEADER_PATTERN = re.compile(r'^(#+)\s+(.+)$', re.MULTILINE)
+
 def extract_section_info(chunk: str) -> dict:
     """Extract headers and stats from a chunk."""
-    headers = re.findall(r'^(#+)\s+(.+)$', chunk, re.MULTILINE)
-    header_str = '; '.join([f'{h[0]} {h[1]}' for h in headers]) if headers else ''
+    headers = HEADER_PATTERN.findall(chunk)
+    header_str = '; '.join(f'{level} {title}' for level, title in headers)
 
     return {
         "headers": header_str,
@@ -92,8 +97,25 @@ def get_original_url_from_filename(filename: str) -> str:
     # Fallback: return the filename as-is
     return f"local://{filename}"
 
-async def crawl_local_file(crawler, supabase_client, file_path: str, delete_existing: bool = True) -> bool:
-    """Crawl a single local HTML file."""
+# Simple, reliable crawl configuration shared by every local file
+LOCAL_FILE_RUN_CONFIG = CrawlerRunConfig(
+    cache_mode=CacheMode.BYPASS, 
+    stream=False,
+    page_timeout=3000,  # 3 seconds timeout for reliability
+    delay_before_return_html=0  # No delay for faster crawling
+)
+
+async def crawl_local_file(crawler, file_path: str) -> dict:
+    """
+    Convert a single local HTML file into chunks ready for storage.
+    
+    Nothing is written to the database here; crawl_local_files collects the
+    results and stores them in groups of STORE_GROUP_SIZE files.
+    
+    Returns:
+        Dictionary with the original URL, source_id, markdown and chunk data,
+        or None if the file could not be processed
+    """
     try:
         logging.info(f"  Reading file: {file_path}")
         
@@ -110,16 +132,8 @@ async def crawl_local_file(crawler, supabase_client, file_path: str, delete_exis
         # Use Crawl4AI's raw content processing
         raw_url = f"raw:{html_content}"
         
-        # Configure the crawl with simple, reliable configuration
-        run_config = CrawlerRunConfig(
-            cache_mode=CacheMode.BYPASS, 
-            stream=False,
-            page_timeout=3000,  # 3 seconds timeout for reliability
-            delay_before_return_html=0  # No delay for faster crawling
-        )
-        
         # Process the HTML with Crawl4AI
-        result = await crawler.arun(url=raw_url, config=run_config)
+        result = await crawler.arun(url=raw_url, config=LOCAL_FILE_RUN_CONFIG)
         
         if result.success and result.markdown:
             logging.info(f"  ✅ Processed successfully")
@@ -142,117 +156,161 @@ async def crawl_local_file(crawler, supabase_client, file_path: str, delete_exis
             chunks = smart_chunk_markdown(result.markdown)
             logging.info(f"  📦 Split into {len(chunks)} chunks")
             
-            # Prepare data for Supabase
-            urls = []
-            chunk_numbers = []
-            contents = []
             metadatas = []
             total_word_count = 0
-            
             for i, chunk in enumerate(chunks):
-                urls.append(original_url)  # Use original URL, not file path
-                chunk_numbers.append(i)
-                contents.append(chunk)
-                
                 # Extract metadata
                 meta = extract_section_info(chunk)
                 meta["chunk_index"] = i
                 meta["url"] = original_url
                 meta["source"] = source_id
+                meta["source_id"] = source_id
                 meta["local_file"] = file_path  # Keep track of local file
                 metadatas.append(meta)
                 
                 # Accumulate word count
                 total_word_count += meta.get("word_count", 0)
             
-            # Create url_to_full_document mapping
-            url_to_full_document = {original_url: result.markdown}
-            
-            logging.info(f"  💾 Storing in database...")
-            
-            # First, create/update the source record
-            source_summary = extract_source_summary(source_id, result.markdown[:5000])
-            update_source_info(supabase_client, source_id, source_summary, total_word_count)
-            
-            # Ensure all metadata contains the correct source_id
-            for meta in metadatas:
-                meta["source_id"] = source_id
-            
-            # Then add documents to Supabase
-            add_documents_to_supabase(supabase_client, urls, chunk_numbers, contents, metadatas, url_to_full_document, delete_existing)
-            
-            # Extract and process code examples if enabled
-            agentic_rag_enabled = os.getenv("USE_AGENTIC_RAG", "false").lower() == "true"
-            if agentic_rag_enabled:
-                logging.info(f"  🔬 Extracting code examples...")
-                code_blocks = extract_code_blocks(result.markdown)
-                
-                if code_blocks:
-                    logging.info(f"  📝 Found {len(code_blocks)} code blocks, generating summaries...")
-                    
-                    # Generate summaries for code examples in parallel
-                    def process_code_example(args):
-                        code, context_before, context_after = args
-                        return generate_code_example_summary(code, context_before, context_after)
-                    
-                    summary_args = [
-                        (block['code'], block['context_before'], block['context_after'])
-                        for block in code_blocks
-                    ]
-                    
-                    with ThreadPoolExecutor(max_workers=3) as executor:
-                        summaries = list(executor.map(process_code_example, summary_args))
-                    
-                    # Prepare code example data
-                    code_urls = []
-                    code_chunk_numbers = []
-                    code_examples = []
-                    code_summaries = []
-                    code_metadatas = []
-                    
-                    for i, (block, summary) in enumerate(zip(code_blocks, summaries)):
-                        code_urls.append(original_url)
-                        code_chunk_numbers.append(i)
-                        code_examples.append(block['code'])
-                        code_summaries.append(summary)
-                        
-                        # Create metadata for code example
-                        code_meta = {
-                            "chunk_index": i,
-                            "url": original_url,
-                            "source": source_id,
-                            "source_id": source_id,
-                            "local_file": file_path,
-                            "code_length": len(block['code']),
-                            "language": block.get('language', 'unknown')
-                        }
-                        code_metadatas.append(code_meta)
-                    
-                    # Add code examples to Supabase
-                    add_code_examples_to_supabase(
-                        supabase_client,
-                        code_urls,
-                        code_chunk_numbers,
-                        code_examples,
-                        code_summaries,
-                        code_metadatas,
-                        delete_existing
-                    )
-                    
-                    logging.info(f"  ✅ Stored {len(code_blocks)} code examples")
-                else:
-                    logging.info(f"  📝 No code blocks found")
-            else:
-                logging.info(f"  🔬 Code example extraction disabled (USE_AGENTIC_RAG=false)")
-            
-            return True
+            return {
+                'file_path': file_path,
+                'url': original_url,  # Use original URL, not file path
+                'source_id': source_id,
+                'markdown': result.markdown,
+                'chunks': chunks,
+                'metadatas': metadatas,
+                'word_count': total_word_count
+            }
         else:
             logging.error(f"  ❌ Failed to process: {getattr(result, 'error_message', 'Unknown error')}")
-            return False
+            return None
             
     except Exception as e:
         logging.error(f"  💥 Error: {e}")
-        return False
+        return None
+
+def store_local_documents(supabase_client, documents: list, delete_existing: bool = True,
+                          source_summaries: dict = None, source_word_counts: dict = None):
+    """
+    Store a group of processed local files in Supabase with one call per phase.
+    
+    Source records are updated once per source, all document chunks go
+    through a single add_documents_to_supabase call, and all code examples
+    through a single add_code_examples_to_supabase call.
+    
+    Args:
+        supabase_client: Supabase client
+        documents: Results of crawl_local_file
+        delete_existing: Whether to delete existing records before inserting
+        source_summaries: Summaries of sources stored by earlier groups of the
+            same run; new sources are summarized and added to it
+        source_word_counts: Word counts of sources stored by earlier groups of
+            the same run; this group's counts are added to it
+        
+    Returns:
+        Set of document URLs with chunks or code examples that could not be written
+    """
+    if source_summaries is None:
+        source_summaries = {}
+    if source_word_counts is None:
+        source_word_counts = {}
+    
+    # Update each source of this group, summarizing a source only the first
+    # time it is seen, from its first document
+    group_sources = {}
+    for doc in documents:
+        source_id = doc['source_id']
+        group_sources.setdefault(source_id, doc['markdown'][:5000])
+        source_word_counts[source_id] = source_word_counts.get(source_id, 0) + doc['word_count']
+    
+    logging.info(f"💾 Updating {len(group_sources)} source records...")
+    for source_id, content in group_sources.items():
+        if source_id not in source_summaries:
+            source_summaries[source_id] = extract_source_summary(source_id, content)
+        update_source_info(supabase_client, source_id, source_summaries[source_id], source_word_counts[source_id])
+    
+    # Flatten the chunks of all files into one batch
+    urls = []
+    chunk_numbers = []
+    contents = []
+    metadatas = []
+    url_to_full_document = {}
+    for doc in documents:
+        url = doc['url']
+        urls.extend([url] * len(doc['chunks']))
+        chunk_numbers.extend(range(len(doc['chunks'])))
+        contents.extend(doc['chunks'])
+        metadatas.extend(doc['metadatas'])
+        url_to_full_document[url] = doc['markdown']
+    
+    logging.info(f"💾 Storing {len(contents)} chunks from {len(documents)} files in database...")
+    failed_urls = add_documents_to_supabase(supabase_client, urls, chunk_numbers, contents, metadatas, url_to_full_document, delete_existing)
+    
+    # Extract and process code examples if enabled
+    agentic_rag_enabled = os.getenv("USE_AGENTIC_RAG", "false").lower() == "true"
+    if not agentic_rag_enabled:
+        logging.info(f"🔬 Code example extraction disabled (USE_AGENTIC_RAG=false)")
+        return failed_urls
+    
+    logging.info(f"🔬 Extracting code examples...")
+    code_urls = []
+    code_chunk_numbers = []
+    code_examples = []
+    code_metadatas = []
+    summary_args = []
+    for doc in documents:
+        for i, block in enumerate(extract_code_blocks(doc['markdown'])):
+            code_urls.append(doc['url'])
+            code_chunk_numbers.append(i)
+            code_examples.append(block['code'])
+            summary_args.append((block['code'], block['context_before'], block['context_after']))
+            
+            # Create metadata for code example
+            code_metadatas.append({
+                "chunk_index": i,
+                "url": doc['url'],
+                "source": doc['source_id'],
+                "source_id": doc['source_id'],
+                "local_file": doc['file_path'],
+                "code_length": len(block['code']),
+                "language": block.get('language', 'unknown')
+            })
+    
+    if not code_examples:
+        logging.info(f"📝 No code blocks found")
+        return failed_urls
+    
+    logging.info(f"📝 Found {len(code_examples)} code blocks, generating summaries...")
+    
+    # Generate summaries for code examples in parallel
+    def process_code_example(args):
+        code, context_before, context_after = args
+        return generate_code_example_summary(code, context_before, context_after)
+    
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        code_summaries = list(executor.map(process_code_example, summary_args))
+    
+    # Add code examples to Supabase; a failure here only affects the
+    # documents that have code examples
+    try:
+        failed_urls |= add_code_examples_to_supabase(
+            supabase_client,
+            code_urls,
+            code_chunk_numbers,
+            code_examples,
+            code_summaries,
+            code_metadatas,
+            delete_existing
+        )
+    except Exception as e:
+        logging.error(f"💥 Error storing code examples: {e}")
+        failed_urls |= set(code_urls)
+    
+    logging.info(f"✅ Stored {len(code_examples)} code examples")
+    return failed_urls
+
+# Processed files stored per group; bounds memory and limits what an
+# interrupted run loses to the files crawled since the last group
+STORE_GROUP_SIZE = 200
 
 async def crawl_local_files(directory: str, delete_existing: bool = True):
     """Crawl all HTML files in a directory."""
@@ -280,26 +338,51 @@ async def crawl_local_files(directory: str, delete_existing: bool = True):
     
     supabase_client = get_supabase_client()
     
+    documents = []
     success_count = 0
     failed_count = 0
+    source_summaries = {}
+    source_word_counts = {}
+    
+    def store_documents():
+        """Store the pending documents; only files whose rows could not be written count as failed."""
+        nonlocal success_count, failed_count
+        try:
+            failed_urls = store_local_documents(supabase_client, documents, delete_existing,
+                                                source_summaries, source_word_counts)
+        except Exception as e:
+            logging.error(f"💥 Error storing documents: {e}")
+            failed_urls = {doc['url'] for doc in documents}
+        not_stored = [doc for doc in documents if doc['url'] in failed_urls]
+        for doc in not_stored:
+            logging.error(f"  ❌ Not stored: {doc['file_path']}")
+        success_count += len(documents) - len(not_stored)
+        failed_count += len(not_stored)
+        documents.clear()
     
     try:
         for i, file_path in enumerate(html_files, 1):
             logging.info(f"[{i}/{len(html_files)}] Processing: {file_path.name}")
             
-            success = await crawl_local_file(crawler, supabase_client, str(file_path), delete_existing)
+            document = await crawl_local_file(crawler, str(file_path))
             
-            if success:
-                success_count += 1
+            if document:
+                documents.append(document)
                 logging.info("  ✅ Success")
             else:
                 failed_count += 1
                 logging.error("  ❌ Failed")
             logging.info("")
+            
+            if len(documents) >= STORE_GROUP_SIZE:
+                store_documents()
         
     finally:
         await crawler.__aexit__(None, None, None)
     
+    if documents:
+        store_documents()
+    
     # Summary
     logging.info("=" * 60)
     logging.info("LOCAL CRAWLING COMPLETE")
@@ -7,18 +7,107 @@ import os
 import sys
 import json
 import asyncio
+import hashlib
+import mmap
 import re
 import logging
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache, partial
 from pathlib import Path
 from typing import List, Dict, Any
 
 # Add src to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
+# xxHash is optional; change detection falls back to SHA-256 without it
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+def find_git_dir(path: str) -> str:
+    """
+    Find the git directory of the repository containing path.
+    
+    Handles both regular checkouts and submodules/worktrees, where .git is a
+    file pointing at the real git directory.
+    
+    Returns:
+        Path to the git directory, or None if path is not inside a repository
+    """
+    current = os.path.abspath(path)
+    while True:
+        dot_git = os.path.join(current, '.git')
+        if os.path.isdir(dot_git):
+            return dot_git
+        if os.path.isfile(dot_git):
+            try:
+                with open(dot_git, 'r', encoding='utf-8') as f:
+                    line = f.readline().strip()
+            except OSError:
+                return None
+            if line.startswith('gitdir:'):
+                return os.path.normpath(os.path.join(current, line[len('gitdir:'):].strip()))
+            return None
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+def read_git_head(path: str) -> str:
+    """
+    Resolve HEAD to a commit SHA by reading the git directory directly.
+    
+    This avoids forking git for the common cases (detached HEAD, loose or
+    packed branch refs). Anything else returns None so the caller can fall
+    back to running git.
+    """
+    git_dir = find_git_dir(path)
+    if not git_dir:
+        return None
+    try:
+        with open(os.path.join(git_dir, 'HEAD'), 'r', encoding='utf-8') as f:
+            head = f.read().strip()
+        if not head.startswith('ref: '):
+            return head or None
+        ref = head[len('ref: '):]
+        
+        # Worktrees keep shared refs in the common directory
+        common_dir = git_dir
+        common_file = os.path.join(git_dir, 'commondir')
+        if os.path.isfile(common_file):
+            with open(common_file, 'r', encoding='utf-8') as f:
+                common_dir = os.path.normpath(os.path.join(git_dir, f.read().strip()))
+        
+        for base in dict.fromkeys((git_dir, common_dir)):
+            ref_path = os.path.join(base, ref)
+            if os.path.isfile(ref_path):
+                with open(ref_path, 'r', encoding='utf-8') as f:
+                    return f.read().strip() or None
+        
+        packed_refs = os.path.join(common_dir, 'packed-refs')
+        if os.path.isfile(packed_refs):
+            with open(packed_refs, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.rstrip('\n').endswith(' ' + ref):
+                        return line.split(' ', 1)[0]
+    except OSError:
+        pass
+    return None
+
+@lru_cache(maxsize=None)
 def get_github_commit_hash(simics_base_path: str) -> str:
-    """Get the current GitHub commit hash for the simics repository."""
+    """
+    Get the current GitHub commit hash for the simics repository.
+    
+    The result is cached per repository path, since every file URL needs it
+    and HEAD does not move during a crawl; call cache_clear() to re-read it.
+    """
+    commit = read_git_head(simics_base_path)
+    if commit:
+        return commit
     try:
         import subprocess
         result = subprocess.run(
@@ -34,26 +123,30 @@ def get_github_commit_hash(simics_base_path: str) -> str:
         # Fallback to known commit
         return "f1b35684a083ae1f33e5f625ba18d2bd50f75f3c"
 
+@lru_cache(maxsize=None)
+def get_github_blob_base(simics_base_path: str):
+    """Return the absolute simics path and the GitHub blob URL prefix for files under it."""
+    github_repo_url = "https://github.com/fenghaitao/simics-7-packages-2025-38-linux64"
+    github_commit = get_github_commit_hash(simics_base_path)
+    return os.path.abspath(simics_base_path), f"{github_repo_url}/blob/{github_commit}/"
+
 def get_github_url_for_file(file_path: str, simics_base_path: str) -> str:
     """Convert a local file path to a GitHub URL."""
     try:
-        # GitHub repository information
-        github_repo_url = "https://github.com/fenghaitao/simics-7-packages-2025-38-linux64"
-        github_commit = get_github_commit_hash(simics_base_path)
+        # Base path and commit are resolved once per simics path
+        base_path, blob_url = get_github_blob_base(simics_base_path)
         
         # Convert absolute path to relative path within the simics directory
         file_path = os.path.abspath(file_path)
-        simics_base_path = os.path.abspath(simics_base_path)
         
         # Get the relative path from the simics base directory
-        if file_path.startswith(simics_base_path):
-            relative_path = os.path.relpath(file_path, simics_base_path)
+        if file_path.startswith(base_path + os.sep):
+            relative_path = file_path[len(base_path) + 1:]
             # Convert Windows-style path separators to forward slashes for URL
             relative_path = relative_path.replace(os.sep, '/')
             
             # Construct GitHub blob URL
-            github_url = f"{github_repo_url}/blob/{github_commit}/{relative_path}"
-            return github_url
+            return blob_url + relative_path
         else:
             # Fallback to file:// URL if path is outside simics directory
             return f"file://{file_path}"
@@ -62,25 +155,74 @@ def get_github_url_for_file(file_path: str, simics_base_path: str) -> str:
         logging.warning(f"Failed to generate GitHub URL for {file_path}: {e}")
         return f"file://{os.path.abspath(file_path)}"
 
+# Map of lowercase file extension -> file type for the sources we ingest
+SOURCE_FILE_TYPES = {
+    '.dml': 'dml',
+    '.py': 'python',
+}
+
+def get_source_file_type(file_name: str):
+    """Return the source file type for a file name, or None if unsupported."""
+    dot = file_name.rfind('.')
+    if dot < 0:
+        return None
+    return SOURCE_FILE_TYPES.get(file_name[dot:].lower())
+
+# Parallel discovery only pays off once the tree has several top-level subdirectories
+DISCOVERY_PARALLEL_MIN_SUBDIRS = 4
+DISCOVERY_MAX_WORKERS = 8
+
+def _walk_source_files(root: str) -> Dict[str, List[str]]:
+    """Recursively collect supported source files under root, bucketed by file type."""
+    found = {file_type: [] for file_type in SOURCE_FILE_TYPES.values()}
+    for dirpath, _dirnames, filenames in os.walk(root):
+        for name in filenames:
+            file_type = get_source_file_type(name)
+            if file_type is not None:
+                found[file_type].append(os.path.join(dirpath, name))
+    return found
+
 def find_simics_source_files(simics_path: str) -> Dict[str, List[str]]:
     """Find DML and Python files in Simics packages."""
-    simics_path = Path(simics_path)
+    simics_path = os.fspath(simics_path)
     
-    if not simics_path.exists():
+    if not os.path.isdir(simics_path):
         logging.error(f"❌ Simics path not found: {simics_path}")
         return {'dml': [], 'python': []}
     
     logging.info(f"🔍 Searching for source files in: {simics_path}")
     start_time = time.time()
     
-    # Find DML files
-    logging.info("   📄 Scanning for DML files...")
-    dml_files = list(simics_path.rglob("*.dml"))
-    logging.info(f"   ✅ Found {len(dml_files)} DML files")
+    # Walk the tree once and bucket files by extension
+    logging.info("   📄 Scanning for DML and Python files...")
+    found = {file_type: [] for file_type in SOURCE_FILE_TYPES.values()}
+    subdirs = []
+    with os.scandir(simics_path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif entry.is_file():
+                file_type = get_source_file_type(entry.name)
+                if file_type is not None:
+                    found[file_type].append(entry.path)
+    
+    # Package trees are wide, so walk the top-level subdirectories in parallel
+    # when there are enough of them to make the thread pool worthwhile
+    if len(subdirs) >= DISCOVERY_PARALLEL_MIN_SUBDIRS:
+        with ThreadPoolExecutor(max_workers=min(DISCOVERY_MAX_WORKERS, len(subdirs))) as executor:
+            subdir_results = list(executor.map(_walk_source_files, subdirs))
+    else:
+        subdir_results = [_walk_source_files(subdir) for subdir in subdirs]
     
-    # Find Python files
-    logging.info("   🐍 Scanning for Python files...")
-    python_files = list(simics_path.rglob("*.py"))
+    for result in subdir_results:
+        for file_type, paths in result.items():
+            found[file_type].extend(paths)
+    for paths in found.values():
+        paths.sort()
+    
+    dml_files = found['dml']
+    python_files = found['python']
+    logging.info(f"   ✅ Found {len(dml_files)} DML files")
     logging.info(f"   ✅ Found {len(python_files)} Python files")
     
     elapsed = time.time() - start_time
@@ -88,10 +230,268 @@ def find_simics_source_files(simics_path: str) -> Dict[str, List[str]]:
     logging.info(f"   🕒 File discovery completed in {elapsed:.1f}s ({total_files} total files)")
     
     return {
-        'dml': [str(f) for f in dml_files],
-        'python': [str(f) for f in python_files]
+        'dml': dml_files,
+        'python': python_files
     }
 
+# Number of files to read ahead of the processing loop
+PREFETCH_WINDOW = 16
+
+# Number of failed files listed individually in the processing summary
+MAX_LOGGED_FAILURES = 20
+
+def prefetch_files(file_paths: List[str]):
+    """Hint the kernel to start reading the given files into the page cache."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for path in file_paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+# Content hash algorithms understood by get_hash_digest
+CONTENT_HASH_ALGORITHMS = ("xxh3", "sha256")
+
+def get_content_hash_algorithm() -> str:
+    """
+    Return the content hash algorithm selected by CONTENT_HASH_ALGORITHM.
+    
+    Unknown values, and xxh3 without the xxhash package, fall back to sha256
+    with a warning, so the returned name always matches the digest used.
+    """
+    algorithm = os.getenv("CONTENT_HASH_ALGORITHM", "xxh3").lower()
+    if algorithm not in CONTENT_HASH_ALGORITHMS:
+        logging.warning(f"⚠️  Unknown CONTENT_HASH_ALGORITHM '{algorithm}', using sha256 for content hashes")
+        return "sha256"
+    if algorithm == "xxh3" and xxhash is None:
+        logging.warning("⚠️  xxhash is not installed, falling back to sha256 for content hashes")
+        return "sha256"
+    return algorithm
+
+def get_hash_digest(algorithm: str):
+    """Return the hash constructor for an algorithm, using sha256 unless xxh3 is available."""
+    if algorithm == "xxh3" and xxhash is not None:
+        return xxhash.xxh3_64
+    return hashlib.sha256
+
+# Files up to this size are hashed through mmap; larger ones are streamed
+MMAP_HASH_MAX_SIZE = 64 * 1024 * 1024
+
+# Block size for streaming larger files through the hash
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def calculate_file_hash_and_stat(file_path: str, algorithm: str = None):
+    """
+    Hash a file's contents and stat it through the same open handle.
+    
+    The stat describes exactly the file that was hashed, and no separate
+    os.stat call is needed to record it.
+    
+    Args:
+        file_path: Path to the file
+        algorithm: 'xxh3' (xxHash3-64, fast, non-cryptographic) or 'sha256';
+            defaults to get_content_hash_algorithm()
+        
+    Returns:
+        Tuple of (hex digest of the file contents, os.stat_result)
+    """
+    digest = get_hash_digest(algorithm or get_content_hash_algorithm())
+    with open(file_path, 'rb', buffering=0) as f:
+        stat = os.fstat(f.fileno())
+        if 0 < stat.st_size <= MMAP_HASH_MAX_SIZE:
+            # Map the file and hash it in one update, with no buffer copies
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return digest(mm).hexdigest(), stat
+        # Stream larger files through one reusable 1 MiB buffer so memory stays constant
+        h = digest()
+        buf = bytearray(HASH_CHUNK_SIZE)
+        view = memoryview(buf)
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+        return h.hexdigest(), stat
+
+def calculate_file_hash(file_path: str, algorithm: str = None, data: bytes = None) -> str:
+    """
+    Hash a file's contents for change detection.
+    
+    Args:
+        file_path: Path to the file
+        algorithm: 'xxh3' (xxHash3-64, fast, non-cryptographic) or 'sha256';
+            defaults to get_content_hash_algorithm()
+        data: The file's bytes, if already read; the file is not opened then
+        
+    Returns:
+        Hex digest of the file contents
+    """
+    algorithm = algorithm or get_content_hash_algorithm()
+    if data is not None:
+        return get_hash_digest(algorithm)(data).hexdigest()
+    return calculate_file_hash_and_stat(file_path, algorithm)[0]
+
+# Sidecar file (inside --output-dir) remembering content hashes between runs
+HASH_CACHE_FILENAME = "simics_hash_cache.json"
+
+# Upper bound on threads used to hash files ahead of processing
+HASH_MAX_WORKERS = 32
+
+def load_hash_cache(cache_path: str, algorithm: str, database_state: Dict[str, Any] = None) -> Dict[str, list]:
+    """
+    Load the content hash cache written by a previous run.
+    
+    Args:
+        cache_path: Path to the JSON sidecar file
+        algorithm: Hash algorithm of the current run; a cache built with a
+            different algorithm is discarded
+        database_state: Current state of the target database (see
+            get_database_state); a cache saved against a different state is
+            discarded, since the files it lists may no longer be stored
+        
+    Returns:
+        Dictionary mapping file path to [mtime_ns, size, content_hash]
+    """
+    if not cache_path or not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"⚠️  Ignoring unreadable hash cache {cache_path}: {e}")
+        return {}
+    if data.get('algorithm') != algorithm:
+        return {}
+    if data.get('database') != database_state:
+        logging.info("   🔄 Database changed since the hash cache was saved, storing all files again")
+        return {}
+    return data.get('files', {})
+
+def save_hash_cache(cache_path: str, algorithm: str, hash_cache: Dict[str, list],
+                    database_state: Dict[str, Any] = None):
+    """Write the content hash cache so the next run can skip re-hashing unchanged files."""
+    try:
+        payload = json.dumps({'algorithm': algorithm, 'database': database_state, 'files': hash_cache})
+        os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+    except OSError as e:
+        logging.warning(f"⚠️  Failed to save hash cache {cache_path}: {e}")
+
+def get_database_state() -> Dict[str, Any]:
+    """
+    Describe what the target database holds for the simics sources.
+    
+    The hash cache only records what was stored in one particular database.
+    Saving this state with it lets the next run notice when the records were
+    deleted (e.g. by delete_all_records.py) or SUPABASE_URL points elsewhere.
+    
+    Returns:
+        Dictionary with the Supabase URL and the crawled_pages row count of
+        each simics source, or None if the database cannot be queried
+    """
+    try:
+        from utils import get_supabase_client
+        client = get_supabase_client()
+        rows = {}
+        for source_id in SOURCE_IDS.values():
+            result = client.table('crawled_pages')\
+                .select('id', count='exact')\
+                .eq('source_id', source_id)\
+                .limit(1)\
+                .execute()
+            rows[source_id] = result.count
+        return {'url': os.getenv("SUPABASE_URL"), 'rows': rows}
+    except Exception as e:
+        logging.warning(f"⚠️  Could not query the database state, the hash cache will not be trusted: {e}")
+        return None
+
+def get_cached_file_status(file_path: str, hash_cache: Dict[str, list]) -> str:
+    """
+    Compare a file's stat against its cache entry, without reading it.
+    
+    Returns:
+        'unchanged' if mtime and size match, 'touched' if only the mtime
+        differs (the content may still be identical), or 'changed' if the size
+        differs or the file is not cached (the content cannot match)
+    """
+    cached = hash_cache.get(file_path)
+    if not cached:
+        return 'changed'
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return 'changed'
+    if cached[1] != stat.st_size:
+        return 'changed'
+    return 'unchanged' if cached[0] == stat.st_mtime_ns else 'touched'
+
+def get_file_hash(file_path: str, algorithm: str, hash_cache: Dict[str, list] = None,
+                  data: bytes = None, stat: os.stat_result = None) -> str:
+    """
+    Return a file's content hash, reusing the cached one when mtime and size are unchanged.
+    
+    If the caller has already read the file, passing its bytes as data hashes
+    them in memory instead of reading the file a second time; likewise a stat
+    result it already has is used instead of statting the file again.
+    """
+    if hash_cache is None:
+        return calculate_file_hash(file_path, algorithm, data)
+    
+    if stat is None and data is None:
+        # Nothing is known about the file yet: hash and stat it in one open
+        content_hash, stat = calculate_file_hash_and_stat(file_path, algorithm)
+        hash_cache[file_path] = [stat.st_mtime_ns, stat.st_size, content_hash]
+        return content_hash
+    
+    if stat is None:
+        stat = os.stat(file_path)
+    cached = hash_cache.get(file_path)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+    
+    content_hash = calculate_file_hash(file_path, algorithm, data)
+    hash_cache[file_path] = [stat.st_mtime_ns, stat.st_size, content_hash]
+    return content_hash
+
+def calculate_file_hashes(file_paths: List[str], algorithm: str, hash_cache: Dict[str, list]):
+    """
+    Hash files on a thread pool and record the results in hash_cache.
+    
+    Hashing releases the GIL for large buffers, so this scales with cores
+    until the disk saturates. Files that cannot be read are left out of the
+    cache and reported later by process_source_file.
+    """
+    def hash_file(file_path):
+        try:
+            get_file_hash(file_path, algorithm, hash_cache)
+        except OSError:
+            # Drop the stale entry so the file counts as changed and its
+            # error is reported instead of it being skipped as unchanged
+            hash_cache.pop(file_path, None)
+    
+    max_workers = min(HASH_MAX_WORKERS, (os.cpu_count() or 1) * 2)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(hash_file, file_paths))
+
+# Metadata extraction patterns, compiled once instead of per file
+DML_DEVICE_PATTERN = re.compile(r'device\s+(\w+)')
+DML_TEMPLATE_PATTERN = re.compile(r'is\s+(\w+)')
+DML_INTERFACE_PATTERN = re.compile(r'implement\s+(\w+)')
+DML_GROUP_PATTERN = re.compile(r'group\s+(\w+)')
+DML_METHOD_PATTERN = re.compile(r'method\s+(\w+)')
+PYTHON_CLASS_PATTERN = re.compile(r'class\s+(\w+)')
+PYTHON_DEF_PATTERN = re.compile(r'def\s+(\w+)')
+PYTHON_SIMICS_IMPORT_PATTERN = re.compile(r'import\s+(simics\S*)')
+PYTHON_SIMICS_FROM_PATTERN = re.compile(r'from\s+(simics\S*)')
+
 def extract_dml_metadata(content: str, file_path: str) -> dict:
     """Extract DML-specific metadata."""
     metadata = {
@@ -101,32 +501,32 @@ def extract_dml_metadata(content: str, file_path: str) -> dict:
     }
     
     # Extract device name
-    device_match = re.search(r'device\s+(\w+)', content)
+    device_match = DML_DEVICE_PATTERN.search(content)
     if device_match:
         metadata['device_name'] = device_match.group(1)
     
     # Extract templates (is template_name)
-    template_matches = re.findall(r'is\s+(\w+)', content)
+    template_matches = DML_TEMPLATE_PATTERN.findall(content)
     if template_matches:
-        metadata['templates'] = list(set(template_matches))
+        metadata['templates'] = list(dict.fromkeys(template_matches))
     
     # Extract interfaces (implement interface_name)
-    interface_matches = re.findall(r'implement\s+(\w+)', content)
+    interface_matches = DML_INTERFACE_PATTERN.findall(content)
     if interface_matches:
-        metadata['interfaces'] = list(set(interface_matches))
+        metadata['interfaces'] = list(dict.fromkeys(interface_matches))
     
     # Extract register groups
-    register_matches = re.findall(r'group\s+(\w+)', content)
+    register_matches = DML_GROUP_PATTERN.findall(content)
     if register_matches:
-        metadata['register_groups'] = list(set(register_matches))
+        metadata['register_groups'] = list(dict.fromkeys(register_matches))
     
     # Extract methods
-    method_matches = re.findall(r'method\s+(\w+)', content)
+    method_matches = DML_METHOD_PATTERN.findall(content)
     if method_matches:
-        metadata['methods'] = list(set(method_matches))
+        metadata['methods'] = list(dict.fromkeys(method_matches))
     
     # Calculate basic stats
-    metadata['line_count'] = len(content.split('\n'))
+    metadata['line_count'] = content.count('\n') + 1
     metadata['char_count'] = len(content)
     
     return metadata
@@ -140,21 +540,21 @@ def extract_python_metadata(content: str, file_path: str) -> dict:
     }
     
     # Extract class definitions
-    class_matches = re.findall(r'class\s+(\w+)', content)
+    class_matches = PYTHON_CLASS_PATTERN.findall(content)
     if class_matches:
-        metadata['classes'] = list(set(class_matches))
+        metadata['classes'] = list(dict.fromkeys(class_matches))
     
     # Extract function definitions
-    function_matches = re.findall(r'def\s+(\w+)', content)
+    function_matches = PYTHON_DEF_PATTERN.findall(content)
     if function_matches:
-        metadata['functions'] = list(set(function_matches))
+        metadata['functions'] = list(dict.fromkeys(function_matches))
     
     # Extract Simics imports
-    simics_imports = re.findall(r'import\s+(simics\S*)', content)
-    simics_from_imports = re.findall(r'from\s+(simics\S*)', content)
+    simics_imports = PYTHON_SIMICS_IMPORT_PATTERN.findall(content)
+    simics_from_imports = PYTHON_SIMICS_FROM_PATTERN.findall(content)
     all_simics_imports = simics_imports + simics_from_imports
     if all_simics_imports:
-        metadata['simics_imports'] = list(set(all_simics_imports))
+        metadata['simics_imports'] = list(dict.fromkeys(all_simics_imports))
     
     # Check if it's a device Python file
     if 'simics' in content and ('device' in content.lower() or 'component' in content.lower()):
@@ -163,61 +563,131 @@ def extract_python_metadata(content: str, file_path: str) -> dict:
         metadata['is_device_implementation'] = False
     
     # Calculate basic stats
-    metadata['line_count'] = len(content.split('\n'))
+    metadata['line_count'] = content.count('\n') + 1
     metadata['char_count'] = len(content)
     
     return metadata
 
+# Per file type dispatch tables, built once at import time
+SOURCE_IDS = {
+    'dml': "simics-dml",
+    'python': "simics-python",
+}
+
+METADATA_EXTRACTORS = {
+    'dml': extract_dml_metadata,
+    'python': extract_python_metadata,
+}
+
 def determine_source_id(file_type: str) -> str:
     """Determine source_id based on file type."""
-    if file_type == 'dml':
-        return "simics-dml"
-    elif file_type == 'python':
-        return "simics-python"
-    else:
-        return "simics-source"
+    return SOURCE_IDS.get(file_type, "simics-source")
 
-def process_source_file(file_path: str, file_index: int = 0, total_files: int = 0) -> Dict[str, Any]:
+def process_source_file(file_path: str, file_index: int = 0, total_files: int = 0,
+                        hash_algorithm: str = None, hash_cache: Dict[str, list] = None) -> Dict[str, Any]:
     """Process a single source file."""
+    hash_algorithm = hash_algorithm or get_content_hash_algorithm()
     try:
-        progress_info = f"[{file_index}/{total_files}]" if total_files > 0 else ""
-        logging.info(f"  📄 {progress_info} Processing: {Path(file_path).name}")
-        
-        # Read file content
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-        
-        # Determine file type
-        file_ext = Path(file_path).suffix.lower()
-        if file_ext == '.dml':
-            file_type = 'dml'
-            metadata = extract_dml_metadata(content, file_path)
-        elif file_ext == '.py':
-            file_type = 'python'
-            metadata = extract_python_metadata(content, file_path)
+        # Per-file messages use lazy %-formatting so nothing is formatted
+        # when INFO is disabled
+        if total_files > 0:
+            logging.info("  📄 [%d/%d] Processing: %s", file_index, total_files, os.path.basename(file_path))
         else:
-            logging.warning(f"    ⚠️  Unknown file type: {file_ext}")
+            logging.info("  📄  Processing: %s", os.path.basename(file_path))
+        
+        # Determine file type before touching the file
+        file_type = get_source_file_type(file_path)
+        extract_metadata = METADATA_EXTRACTORS.get(file_type)
+        if extract_metadata is None:
+            logging.warning(f"    ⚠️  Unknown file type: {os.path.splitext(file_path)[1]}")
             return None
         
+        # Read the raw bytes once: they are hashed directly (unless the hash
+        # is already cached) and decoded for metadata extraction
+        with open(file_path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            raw = f.read()
+        content = raw.decode('utf-8', errors='ignore')
+        if '\r' in content:
+            # Match text-mode universal newline handling
+            content = content.replace('\r\n', '\n').replace('\r', '\n')
+        
+        metadata = extract_metadata(content, file_path)
+        
+        # Record a content hash so unchanged files can be detected on re-runs
+        metadata['content_hash'] = get_file_hash(file_path, hash_algorithm, hash_cache, raw, stat)
+        metadata['content_hash_algorithm'] = hash_algorithm
+        
         # Determine source ID
         source_id = determine_source_id(file_type)
         
-        logging.info(f"    ✅ {file_type.upper()} file, {len(content)} chars, source_id: {source_id}")
+        logging.info("    ✅ %s file, %d chars, source_id: %s", file_type.upper(), len(content), source_id)
         
         return {
             'file_path': file_path,
             'content': content,
             'file_type': file_type,
             'source_id': source_id,
-            'metadata': metadata
+            'metadata': metadata,
+            'stat': stat
         }
         
     except Exception as e:
         logging.error(f"    ❌ Error processing {file_path}: {e}")
         return None
 
-async def add_source_files_to_supabase(processed_files: List[Dict[str, Any]], simics_base_path: str, delete_existing: bool = True):
-    """Add processed source files to Supabase."""
+# Files handed to each process pool worker at a time
+PARALLEL_CHUNK_SIZE = 16
+
+def get_parallel_workers() -> int:
+    """Return the number of processes used to process source files (SIMICS_PARALLEL_WORKERS)."""
+    try:
+        return max(1, int(os.getenv("SIMICS_PARALLEL_WORKERS", "1")))
+    except ValueError:
+        return 1
+
+def iter_processed_source_files(file_paths: List[str], hash_algorithm: str,
+                                hash_cache: Dict[str, list], workers: int = 1):
+    """
+    Process source files in order, yielding (file_path, result) pairs.
+    
+    With a single worker files are processed in this process, reading ahead
+    the next window of files. With more, metadata extraction is spread over a
+    process pool; workers cannot share hash_cache, so the hashes and stats
+    they return are recorded into it here.
+    """
+    total_files = len(file_paths)
+    if workers <= 1 or total_files <= PARALLEL_CHUNK_SIZE:
+        prefetch_files(file_paths[:PREFETCH_WINDOW])
+        for file_index, file_path in enumerate(file_paths, 1):
+            # Read ahead the next window while this one is being processed
+            if (file_index - 1) % PREFETCH_WINDOW == 0:
+                prefetch_files(file_paths[file_index - 1 + PREFETCH_WINDOW:file_index - 1 + 2 * PREFETCH_WINDOW])
+            yield file_path, process_source_file(file_path, file_index, total_files, hash_algorithm, hash_cache)
+        return
+    
+    worker = partial(process_source_file, total_files=total_files, hash_algorithm=hash_algorithm)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(worker, file_paths, range(1, total_files + 1),
+                               chunksize=PARALLEL_CHUNK_SIZE)
+        for file_path, result in zip(file_paths, results):
+            if result and hash_cache is not None:
+                stat = result['stat']
+                hash_cache[file_path] = [stat.st_mtime_ns, stat.st_size, result['metadata']['content_hash']]
+            yield file_path, result
+
+async def add_source_files_to_supabase(processed_files: List[Dict[str, Any]], simics_base_path: str, delete_existing: bool = True) -> List[str]:
+    """
+    Add processed source files to Supabase.
+    
+    Each source is stored as its own batch; a failing batch or a row that
+    cannot be written only affects the files concerned.
+    
+    Returns:
+        Paths of the files whose chunks and code examples were all written
+    """
+    summary_executor = None
+    stored_paths = []
     try:
         from utils import get_supabase_client, add_documents_to_supabase
         from utils import extract_code_blocks, generate_code_example_summary, add_code_examples_to_supabase
@@ -227,11 +697,18 @@ async def add_source_files_to_supabase(processed_files: List[Dict[str, Any]], si
         sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
         from crawl4ai_mcp import smart_chunk_markdown
         from urllib.parse import urlparse
-        from concurrent.futures import ThreadPoolExecutor
         
         client = get_supabase_client()
         agentic_rag_enabled = os.getenv("USE_AGENTIC_RAG", "false").lower() == "true"
         
+        # Build the summary helper and its worker pool once for the whole run
+        # instead of once per file.
+        def process_code_example(args):
+            code, context_before, context_after = args
+            return generate_code_example_summary(code, context_before, context_after)
+        
+        summary_executor = ThreadPoolExecutor(max_workers=3) if agentic_rag_enabled else None
+        
         logging.info(f"\n💾 Adding {len(processed_files)} source files to Supabase...")
         logging.info(f"🔬 Agentic RAG (code examples): {'Enabled' if agentic_rag_enabled else 'Disabled'}")
         
@@ -263,6 +740,18 @@ async def add_source_files_to_supabase(processed_files: List[Dict[str, Any]], si
             all_code_examples = []
             all_code_summaries = []
             all_code_metadatas = []
+            pending_code_examples = []
+            
+            # Every path stored in this batch, mapped to the URL it is stored under
+            file_urls = {}
+            
+            # The Simics packages ship many byte-identical copies of the same
+            # file. Each copy is stored under its own URL, so no copy depends
+            # on another one being re-stored, but the chunks, code blocks and
+            # summaries of the first copy are reused for the others; repeated
+            # chunk texts are also embedded only once by add_documents_to_supabase.
+            chunks_by_hash = {}
+            code_examples_by_hash = {}
             
             file_batch_count = 0
             for file_data in files:
@@ -273,26 +762,30 @@ async def add_source_files_to_supabase(processed_files: List[Dict[str, Any]], si
                 
                 # Create GitHub URL for the source file
                 file_url = get_github_url_for_file(file_path, simics_base_path)
+                file_urls[file_path] = file_url
+                
+                # Chunk the content, unless an identical copy already was
+                content_hash = metadata['content_hash']
+                chunks = chunks_by_hash.get(content_hash)
+                if chunks is None:
+                    chunks = chunks_by_hash[content_hash] = smart_chunk_markdown(content)
+                logging.info("  📦 [%d/%d] %s: %d chunks", file_batch_count, len(files), os.path.basename(file_path), len(chunks))
                 
-                # Chunk the content
-                chunks = smart_chunk_markdown(content)
-                logging.info(f"  📦 [{file_batch_count}/{len(files)}] {Path(file_path).name}: {len(chunks)} chunks")
+                # Metadata shared by every chunk of this file; only the chunk
+                # index is set per chunk
+                chunk_base_metadata = {
+                    **metadata,
+                    "url": file_url,
+                    "source_id": source_id,
+                    "crawl_time": "simics_source_crawl"
+                }
                 
                 # Add chunks for document storage
                 for i, chunk in enumerate(chunks):
                     urls.append(file_url)
                     chunk_numbers.append(i)
                     contents.append(chunk)
-                    
-                    # Enhance metadata with chunk info
-                    chunk_metadata = metadata.copy()
-                    chunk_metadata.update({
-                        "chunk_index": i,
-                        "url": file_url,
-                        "source_id": source_id,
-                        "crawl_time": "simics_source_crawl"
-                    })
-                    metadatas.append(chunk_metadata)
+                    metadatas.append({**chunk_base_metadata, "chunk_index": i})
                 
                 # Store full document mapping
                 url_to_full_document[file_url] = content
@@ -300,75 +793,95 @@ async def add_source_files_to_supabase(processed_files: List[Dict[str, Any]], si
                 # Extract code examples if enabled
                 if agentic_rag_enabled:
                     try:
-                        code_blocks = extract_code_blocks(content)
-                        if code_blocks:
-                            logging.info(f"    🔬 Found {len(code_blocks)} code blocks")
+                        file_code_examples = code_examples_by_hash.get(content_hash)
+                        if file_code_examples is None:
+                            code_blocks = extract_code_blocks(content)
+                            if code_blocks:
+                                logging.info("    🔬 Found %d code blocks", len(code_blocks))
                             
-                            # Generate summaries for code examples
-                            def process_code_example(args):
-                                code, context_before, context_after = args
-                                return generate_code_example_summary(code, context_before, context_after)
-                            
-                            summary_args = [
-                                (block['code'], block['context_before'], block['context_after'])
+                            # Queue the summaries without waiting, so they run
+                            # while the remaining files are chunked
+                            summary_futures = [
+                                summary_executor.submit(
+                                    process_code_example,
+                                    (block['code'], block['context_before'], block['context_after'])
+                                )
                                 for block in code_blocks
                             ]
-                            
-                            with ThreadPoolExecutor(max_workers=3) as executor:
-                                summaries = list(executor.map(process_code_example, summary_args))
-                            
-                            # Add to code examples batch
-                            for i, (block, summary) in enumerate(zip(code_blocks, summaries)):
-                                all_code_urls.append(file_url)
-                                all_code_chunk_numbers.append(i)
-                                all_code_examples.append(block['code'])
-                                all_code_summaries.append(summary)
-                                
-                                # Create metadata for code example
-                                code_meta = metadata.copy()
-                                code_meta.update({
-                                    "chunk_index": i,
-                                    "url": file_url,
-                                    "source_id": source_id,
-                                    "code_length": len(block['code']),
-                                    "block_type": block.get('type', 'unknown')
-                                })
-                                all_code_metadatas.append(code_meta)
+                            file_code_examples = code_examples_by_hash[content_hash] = (code_blocks, summary_futures)
+                        code_blocks, summary_futures = file_code_examples
+                        if code_blocks:
+                            pending_code_examples.append((
+                                file_url,
+                                code_blocks,
+                                {**metadata, "url": file_url, "source_id": source_id},
+                                summary_futures
+                            ))
                         
                     except Exception as e:
                         logging.warning(f"    ⚠️  Error extracting code examples: {e}")
             
+            # Collect the queued summaries into the code examples batch
+            for file_url, code_blocks, code_base_metadata, summary_futures in pending_code_examples:
+                for i, (block, summary_future) in enumerate(zip(code_blocks, summary_futures)):
+                    all_code_urls.append(file_url)
+                    all_code_chunk_numbers.append(i)
+                    all_code_examples.append(block['code'])
+                    all_code_summaries.append(summary_future.result())
+                    
+                    # Create metadata for code example
+                    all_code_metadatas.append({
+                        **code_base_metadata,
+                        "chunk_index": i,
+                        "code_length": len(block['code']),
+                        "block_type": block.get('type', 'unknown')
+                    })
+            
+            failed_urls = set()
             if urls:
-                # Update source information first
-                source_summary = f"{source_id} source code containing {len(set(urls))} files"
-                total_chars = sum(len(content) for content in contents)
-                update_source_info(client, source_id, source_summary, total_chars // 4)  # Rough word estimate
-                
-                # Add documents to Supabase
-                logging.info(f"  💾 Storing {len(contents)} document chunks...")
-                add_documents_to_supabase(client, urls, chunk_numbers, contents, metadatas, url_to_full_document, delete_existing)
-                
-                # Add code examples if any
-                if agentic_rag_enabled and all_code_examples:
-                    logging.info(f"  🔬 Storing {len(all_code_examples)} code examples...")
-                    add_code_examples_to_supabase(
-                        client,
-                        all_code_urls,
-                        all_code_chunk_numbers,
-                        all_code_examples,
-                        all_code_summaries,
-                        all_code_metadatas,
-                        delete_existing
-                    )
-        
-        logging.info(f"\n✅ Successfully added all source files to Supabase!")
+                try:
+                    # Update source information first
+                    source_summary = f"{source_id} source code containing {len(set(urls))} files"
+                    total_chars = sum(len(content) for content in contents)
+                    update_source_info(client, source_id, source_summary, total_chars // 4)  # Rough word estimate
+                    
+                    # Add documents to Supabase
+                    logging.info(f"  💾 Storing {len(contents)} document chunks...")
+                    failed_urls |= add_documents_to_supabase(client, urls, chunk_numbers, contents, metadatas, url_to_full_document, delete_existing)
+                    
+                    # Add code examples if any
+                    if agentic_rag_enabled and all_code_examples:
+                        logging.info(f"  🔬 Storing {len(all_code_examples)} code examples...")
+                        failed_urls |= add_code_examples_to_supabase(
+                            client,
+                            all_code_urls,
+                            all_code_chunk_numbers,
+                            all_code_examples,
+                            all_code_summaries,
+                            all_code_metadatas,
+                            delete_existing
+                        )
+                except Exception as e:
+                    logging.error(f"  ❌ Error storing source {source_id}: {e}")
+                    failed_urls = set(file_urls.values())
+            
+            if failed_urls:
+                logging.warning(f"  ⚠️  {len(failed_urls)} files of {source_id} could not be stored")
+            stored_paths.extend(path for path, url in file_urls.items() if url not in failed_urls)
+        
+        logging.info(f"\n✅ Stored {len(stored_paths)} source files in Supabase")
+        return stored_paths
         
     except Exception as e:
         logging.error(f"❌ Error adding source files to Supabase: {e}")
         import traceback
         traceback.print_exc()
+        return stored_paths
+    finally:
+        if summary_executor is not None:
+            summary_executor.shutdown(wait=True)
 
-async def crawl_simics_source(delete_existing: bool = True):
+async def crawl_simics_source(delete_existing: bool = True, output_dir: str = None):
     """Main function to crawl Simics source code."""
     # Get Simics path from environment
     simics_path = os.getenv("SIMICS_SOURCE_PATH", "simics-7-packages-2025-38-linux64/")
@@ -391,7 +904,8 @@ async def crawl_simics_source(delete_existing: bool = True):
     # Process all files
     processed_files = []
     success_count = 0
-    file_index = 0
+    skipped_count = 0
+    failed_files = []
     processing_start_time = time.time()
     
     def log_progress_and_eta(current_file, total_files, start_time):
@@ -404,42 +918,92 @@ async def crawl_simics_source(delete_existing: bool = True):
             progress_pct = (current_file / total_files) * 100
             logging.info(f"   📈 Progress: {current_file}/{total_files} ({progress_pct:.1f}%) | ETA: {eta_str} | Avg: {avg_time_per_file:.2f}s/file")
     
-    # Process DML files
-    if source_files['dml']:
-        logging.info(f"\n🔧 Processing {len(source_files['dml'])} DML files...")
-        for i, dml_file in enumerate(source_files['dml'], 1):
-            file_index += 1
-            result = process_source_file(dml_file, file_index, total_files)
-            if result:
-                processed_files.append(result)
-                success_count += 1
-            
-            # Log progress every 10 files or on important milestones
-            if file_index % 10 == 0 or file_index == total_files or i == len(source_files['dml']):
-                log_progress_and_eta(file_index, total_files, processing_start_time)
-    
-    # Process Python files
-    if source_files['python']:
-        logging.info(f"\n🐍 Processing {len(source_files['python'])} Python files...")
-        for i, py_file in enumerate(source_files['python'], 1):
-            file_index += 1
-            result = process_source_file(py_file, file_index, total_files)
-            if result:
-                processed_files.append(result)
-                success_count += 1
+    hash_algorithm = get_content_hash_algorithm()
+    hash_cache_path = os.path.join(output_dir, HASH_CACHE_FILENAME) if output_dir else None
+    # The cache only says which files are stored if the database still holds
+    # what it did when the cache was saved
+    database_state = get_database_state() if hash_cache_path else None
+    hash_cache = load_hash_cache(hash_cache_path, hash_algorithm, database_state) if database_state else {}
+    
+    # Forget files that no longer exist, so the cache does not keep growing
+    found_files = set(source_files['dml']).union(source_files['python'])
+    for path in [path for path in hash_cache if path not in found_files]:
+        del hash_cache[path]
+    logging.info(f"   🔑 Content hash: {hash_algorithm}"
+                 + (f" (cache: {hash_cache_path}, {len(hash_cache)} entries)" if hash_cache_path else ""))
+    
+    # In incremental mode, files whose mtime and size match the cache were
+    # already stored by a previous run and can be skipped without reading them
+    dml_files = source_files['dml']
+    python_files = source_files['python']
+    incremental = bool(hash_cache) and not delete_existing
+    if incremental:
+        cache_status = {f: get_cached_file_status(f, hash_cache) for f in dml_files + python_files}
+        dml_files = [f for f in dml_files if cache_status[f] != 'unchanged']
+        python_files = [f for f in python_files if cache_status[f] != 'unchanged']
+        skipped_count = total_files - len(dml_files) - len(python_files)
+        logging.info(f"   ⏭️  Skipping {skipped_count} files unchanged since the last run")
+        
+        # Files that were touched (new mtime, same size) may still hash the
+        # same as last run; re-hash just those up front in parallel so they can
+        # be dropped before processing. Files whose size changed cannot match
+        # and are hashed from the bytes process_source_file reads anyway.
+        previous_hashes = {f: hash_cache[f][2] for f, status in cache_status.items() if status == 'touched'}
+        if previous_hashes:
+            calculate_file_hashes(list(previous_hashes), hash_algorithm, hash_cache)
             
-            # Log progress every 10 files or on important milestones
-            if file_index % 10 == 0 or file_index == total_files or i == len(source_files['python']):
-                log_progress_and_eta(file_index, total_files, processing_start_time)
+            # Touched files with an unchanged hash are already stored
+            # correctly, so skip reading and re-embedding them
+            def content_changed(file_path):
+                previous = previous_hashes.get(file_path)
+                current = hash_cache.get(file_path)
+                return previous is None or current is None or current[2] != previous
+            pending_before = len(dml_files) + len(python_files)
+            dml_files = [f for f in dml_files if content_changed(f)]
+            python_files = [f for f in python_files if content_changed(f)]
+            touched_count = pending_before - len(dml_files) - len(python_files)
+            skipped_count += touched_count
+            logging.info(f"   ⏭️  Skipping {touched_count} touched files whose content is unchanged")
+    
+    dml_count = len(dml_files)
+    all_files = dml_files + python_files
+    pending_count = len(all_files)
+    
+    # Process DML and Python files in a single pass
+    workers = get_parallel_workers()
+    logging.info(f"\n🔧 Processing {dml_count} DML and {len(python_files)} Python files"
+                 + (f" with {workers} worker processes..." if workers > 1 else "..."))
+    processed = iter_processed_source_files(all_files, hash_algorithm, hash_cache, workers)
+    for file_index, (file_path, result) in enumerate(processed, 1):
+        if result:
+            processed_files.append(result)
+            success_count += 1
+        else:
+            failed_files.append(file_path)
+        
+        # Log progress every 10 files or on important milestones
+        if file_index % 10 == 0 or file_index == pending_count or file_index == dml_count:
+            log_progress_and_eta(file_index, pending_count, processing_start_time)
     
     processing_elapsed = time.time() - processing_start_time
     
+    # Identical copies are still stored under their own URLs, but are only
+    # chunked and embedded once (see add_source_files_to_supabase)
+    unique_count = len({(f['source_id'], f['metadata']['content_hash']) for f in processed_files})
+    duplicate_count = len(processed_files) - unique_count
+    
     logging.info(f"\n📊 Processing Summary:")
     logging.info(f"   Total files found: {total_files}")
     logging.info(f"   Successfully processed: {success_count}")
-    logging.info(f"   Failed: {total_files - success_count}")
+    logging.info(f"   Skipped (unchanged): {skipped_count}")
+    logging.info(f"   Identical copies (embedded once): {duplicate_count}")
+    logging.info(f"   Failed: {len(failed_files)}")
+    for failed_path in failed_files[:MAX_LOGGED_FAILURES]:
+        logging.info(f"     ❌ {failed_path}")
+    if len(failed_files) > MAX_LOGGED_FAILURES:
+        logging.info(f"     ... and {len(failed_files) - MAX_LOGGED_FAILURES} more")
     logging.info(f"   Processing time: {int(processing_elapsed // 60)}m {int(processing_elapsed % 60)}s")
-    logging.info(f"   Average time per file: {processing_elapsed / total_files:.2f}s")
+    logging.info(f"   Average time per file: {processing_elapsed / max(pending_count, 1):.2f}s")
     
     if processed_files:
         # Add to Supabase
@@ -453,15 +1017,33 @@ async def crawl_simics_source(delete_existing: bool = True):
             logging.info(f"   🔍 Sample URL: {sample_url}")
         
         upload_start_time = time.time()
-        await add_source_files_to_supabase(processed_files, simics_path, delete_existing)
+        stored_paths = await add_source_files_to_supabase(processed_files, simics_path, delete_existing)
         upload_elapsed = time.time() - upload_start_time
         
+        # Only remember hashes of files that were actually stored, so files
+        # that failed to process or upload are retried on the next run
+        if hash_cache_path:
+            stored = set(stored_paths)
+            not_stored = [path for path in all_files if path not in stored]
+            for path in not_stored:
+                hash_cache.pop(path, None)
+            if not_stored:
+                logging.warning(f"   ⚠️  {len(not_stored)} files were not stored and will be retried on the next run")
+            save_hash_cache(hash_cache_path, hash_algorithm, hash_cache, get_database_state())
+        
         total_elapsed = time.time() - start_time
         logging.info(f"\n⏱️ Timing Summary:")
         logging.info(f"   File processing: {int(processing_elapsed // 60)}m {int(processing_elapsed % 60)}s")
         logging.info(f"   Database upload: {int(upload_elapsed // 60)}m {int(upload_elapsed % 60)}s")
         logging.info(f"   Total runtime: {int(total_elapsed // 60)}m {int(total_elapsed % 60)}s")
         return True
+    elif skipped_count and not failed_files:
+        logging.info("\n✅ All source files are unchanged since the last run, nothing to upload")
+        # Nothing was written, but touched files were re-hashed and deleted
+        # files dropped; save that so the next run does not redo it
+        if hash_cache_path:
+            save_hash_cache(hash_cache_path, hash_algorithm, hash_cache, database_state)
+        return True
     else:
         logging.error("❌ No files were successfully processed")
         return False
@@ -516,7 +1098,7 @@ Examples:
   python crawl_simics_source.py --log-file logs/simics_$(date +%Y%m%d_%H%M%S).log
         """
     )
-    parser.add_argument('--output-dir', help='Output directory (unused, for pipeline compatibility)')
+    parser.add_argument('--output-dir', help='Output directory; holds the content hash cache reused between runs')
     parser.add_argument('--log-file', '-l', help='Optional log file to save detailed output (with timestamps)')
     
     parser.add_argument(
@@ -562,7 +1144,7 @@ Examples:
         return
     
     try:
-        success = asyncio.run(crawl_simics_source(delete_existing))
+        success = asyncio.run(crawl_simics_source(delete_existing, args.output_dir))
         if success:
             logging.info("\n🎉 Simics source code crawling completed successfully!")
         else:
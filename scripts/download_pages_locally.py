@@ -64,9 +64,10 @@ def create_file_urls_json(local_files: list, output_file: str):
             file_url = f"file://{filepath}"
             file_urls.append(file_url)
     
-    # Save to JSON
+    # Save to JSON in a single write
+    payload = json.dumps(file_urls, indent=2)
     with open(output_file, 'w') as f:
-        json.dump(file_urls, f, indent=2)
+        f.write(payload)
     
     print(f"\n📄 Created {output_file} with {len(file_urls)} file:// URLs")
 
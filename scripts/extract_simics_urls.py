@@ -85,8 +85,9 @@ async def extract_simics_urls(index_url: str):
 
 def save_urls_to_json(urls, filename="extracted_urls.json"):
     """Save URLs to a JSON file."""
+    payload = json.dumps(urls, indent=2)
     with open(filename, 'w') as f:
-        json.dump(urls, f, indent=2)
+        f.write(payload)
     
     print(f"\n✅ Saved {len(urls)} URLs to {filename}")
     print(f"📝 You can now crawl all URLs with:")
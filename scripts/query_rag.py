@@ -36,11 +36,13 @@ def query_documents(query: str, source_type: str = 'all', match_count: int = 5,
         
         if source_type == 'docs':
             # For docs, search all non-simics sources by excluding simics-dml and simics-python
-            # Get all available sources first, then filter out simics sources
-            sources_result = client.from_('sources').select('source_id').execute()
+            # Exclude simics sources in the database rather than fetching every source
+            sources_result = client.from_('sources')\
+                .select('source_id')\
+                .not_.in_('source_id', ['simics-dml', 'simics-python'])\
+                .execute()
             if sources_result.data:
-                non_simics_sources = [s['source_id'] for s in sources_result.data 
-                                    if s['source_id'] not in ['simics-dml', 'simics-python']]
+                non_simics_sources = [s['source_id'] for s in sources_result.data]
                 if non_simics_sources:
                     print(f"🎯 Documentation filter: searching {len(non_simics_sources)} non-simics sources (excludes simics-dml, simics-python)")
         elif source_type == 'dml':
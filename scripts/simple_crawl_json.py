@@ -52,25 +52,27 @@ def smart_chunk_markdown(text: str, chunk_size: int = 5000) -> list:
             chunks.append(text[start:].strip())
             break
 
+        # Break points are searched within text[start:end] by offset, so the
+        # window is never copied out of the text
+        min_break = chunk_size * 0.3
+
         # Try to find a code block boundary first (```)
-        chunk = text[start:end]
-        code_block = chunk.rfind('```')
-        if code_block != -1 and code_block > chunk_size * 0.3:
-            end = start + code_block
+        code_block = text.rfind('```', start, end)
+        if code_block != -1 and code_block - start > min_break:
+            end = code_block
 
-        # If no code block, try to break at a paragraph
-        elif '\n\n' in chunk:
-            # Find the last paragraph break
-            last_break = chunk.rfind('\n\n')
-            if last_break > chunk_size * 0.3:  # Only break if we're past 30% of chunk_size
-                end = start + last_break
+        else:
+            # If no code block, try to break at the last paragraph
+            last_break = text.rfind('\n\n', start, end)
+            if last_break != -1:
+                if last_break - start > min_break:  # Only break if we're past 30% of chunk_size
+                    end = last_break
 
-        # If no paragraph break, try to break at a sentence
-        elif '. ' in chunk:
-            # Find the last sentence break
-            last_period = chunk.rfind('. ')
-            if last_period > chunk_size * 0.3:  # Only break if we're past 30% of chunk_size
-                end = start + last_period + 1
+            # If no paragraph break, try to break at the last sentence
+            else:
+                last_period = text.rfind('. ', start, end)
+                if last_period != -1 and last_period - start > min_break:
+                    end = last_period + 1
 
         # Extract chunk and clean it up
         chunk = text[start:end].strip()
@@ -82,10 +84,13 @@ def smart_chunk_markdown(text: str, chunk_size: int = 5000) -> list:
 
     return chunks
 
+# Markdown ATX headers, matched line by line
+HEADER_PATTERN = re.compile(r'^(#+)\s+(.+)$', re.MULTILINE)
+
 def extract_section_info(chunk: str) -> dict:
     """Extract headers and stats from a chunk."""
-    headers = re.findall(r'^(#+)\s+(.+)$', chunk, re.MULTILINE)
-    header_str = '; '.join([f'{h[0]} {h[1]}' for h in headers]) if headers else ''
+    headers = HEADER_PATTERN.findall(chunk)
+    header_str = '; '.join(f'{level} {title}' for level, title in headers)
 
     return {
         "headers": header_str,
@@ -93,21 +98,22 @@ def extract_section_info(chunk: str) -> dict:
         "word_count": len(chunk.split())
     }
 
+# Crawl configuration shared by every URL (JavaScript is disabled at
+# browser level if needed)
+URL_RUN_CONFIG = CrawlerRunConfig(
+    cache_mode=CacheMode.BYPASS, 
+    stream=False,
+    wait_for="css:body",  # Wait for body tag to be loaded
+    delay_before_return_html=1.0  # Give page time to load
+)
+
 async def crawl_single_url(crawler, supabase_client, url: str) -> bool:
     """Crawl a single URL and store in Supabase."""
     try:
         print(f"  Fetching content...")
         
-        # Configure the crawl (JavaScript is disabled at browser level if needed)
-        run_config = CrawlerRunConfig(
-            cache_mode=CacheMode.BYPASS, 
-            stream=False,
-            wait_for="css:body",  # Wait for body tag to be loaded
-            delay_before_return_html=1.0  # Give page time to load
-        )
-        
         # Crawl the page
-        result = await crawler.arun(url=url, config=run_config)
+        result = await crawler.arun(url=url, config=URL_RUN_CONFIG)
         
         if result.success and result.markdown:
             print(f"  Got {len(result.markdown)} chars of content")
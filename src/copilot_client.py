@@ -5,6 +5,7 @@ Handles both embeddings and chat completions using GitHub Copilot API
 """
 
 import asyncio
+import concurrent.futures
 import httpx
 import os
 import json
@@ -427,6 +428,33 @@ async def get_copilot_client() -> Optional[CopilotClient]:
     return _copilot_client
 
 
+def run_coroutine_sync(make_coroutine):
+    """
+    Run a coroutine to completion from synchronous code.
+    
+    Without a running event loop it is run directly with asyncio.run();
+    inside one (e.g. when called from an MCP tool) it is run on a separate
+    thread with its own loop. Only the loop check is guarded, so errors
+    raised by the coroutine itself propagate unchanged and it is never run
+    twice.
+    
+    Args:
+        make_coroutine: Zero-argument callable returning the coroutine
+        
+    Returns:
+        The coroutine's result
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        # No event loop running, safe to use asyncio.run()
+        return asyncio.run(make_coroutine())
+    
+    # We're in an event loop, so we need to run in a thread
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, make_coroutine()).result()
+
+
 # Sync wrapper functions for backward compatibility
 def create_embeddings_batch_copilot(texts: List[str]) -> List[List[float]]:
     """
@@ -451,17 +479,7 @@ def create_embeddings_batch_copilot(texts: List[str]) -> List[List[float]]:
             return [[0.0] * 1536 for _ in texts]
     
     try:
-        # Check if we're already in an event loop
-        try:
-            loop = asyncio.get_running_loop()
-            # If we get here, we're in an event loop, so we need to run in a thread
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(asyncio.run, _create())
-                return future.result()
-        except RuntimeError:
-            # No event loop running, safe to use asyncio.run()
-            return asyncio.run(_create())
+        return run_coroutine_sync(_create)
     except Exception as e:
         print(f"Error running async Copilot batch embeddings: {e}")
         return [[0.0] * 1536 for _ in texts]
@@ -490,17 +508,7 @@ def create_embedding_copilot(text: str) -> List[float]:
             return [0.0] * 1536
     
     try:
-        # Check if we're already in an event loop
-        try:
-            loop = asyncio.get_running_loop()
-            # If we get here, we're in an event loop, so we need to run in a thread
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(asyncio.run, _create())
-                return future.result()
-        except RuntimeError:
-            # No event loop running, safe to use asyncio.run()
-            return asyncio.run(_create())
+        return run_coroutine_sync(_create)
     except Exception as e:
         print(f"Error running async Copilot single embedding: {e}")
         return [0.0] * 1536
@@ -544,17 +552,7 @@ def create_chat_completion_copilot(
             raise
     
     try:
-        # Check if we're already in an event loop
-        try:
-            loop = asyncio.get_running_loop()
-            # If we get here, we're in an event loop, so we need to run in a thread
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(asyncio.run, _create())
-                return future.result()
-        except RuntimeError:
-            # No event loop running, safe to use asyncio.run()
-            return asyncio.run(_create())
+        return run_coroutine_sync(_create)
     except Exception as e:
         print(f"Error running async Copilot chat completion: {e}")
         raise
\ No newline at end of file
@@ -34,17 +34,20 @@ from utils import (
     get_supabase_client, 
     add_documents_to_supabase, 
     search_documents,
+    create_embedding,
     extract_code_blocks,
     generate_code_example_summary,
     add_code_examples_to_supabase,
     update_source_info,
     extract_source_summary,
-    search_code_examples
+    get_docs_source_ids,
+    # Aliased: the search_code_examples MCP tool below shadows this name
+    search_code_examples as search_code_examples_impl
 )
 
 # Import knowledge graph modules
 from knowledge_graph_validator import KnowledgeGraphValidator
-from parse_repo_into_neo4j import DirectNeo4jExtractor
+from parse_repo_into_neo4j import DirectNeo4jExtractor, get_repo_name
 from ai_script_analyzer import AIScriptAnalyzer
 from hallucination_reporter import HallucinationReporter
 
@@ -55,6 +58,9 @@ dotenv_path = project_root / '.env'
 # Force override of existing environment variables
 load_dotenv(dotenv_path, override=True)
 
+# Maximum number of per-source searches run concurrently in execute_multi_source_search
+MAX_CONCURRENT_SOURCE_SEARCHES = 8
+
 # Helper functions for Neo4j validation and error handling
 def validate_neo4j_connection() -> bool:
     """Check if Neo4j environment variables are configured."""
@@ -110,7 +116,7 @@ def validate_github_url(repo_url: str) -> Dict[str, Any]:
     if not (repo_url.startswith("https://") or repo_url.startswith("git@")):
         return {"valid": False, "error": "Repository URL must start with https:// or git@"}
     
-    return {"valid": True, "repo_name": repo_url.split('/')[-1].replace('.git', '')}
+    return {"valid": True, "repo_name": get_repo_name(repo_url)}
 
 # Create a dataclass for our application context
 @dataclass
@@ -378,9 +384,10 @@ def execute_multi_source_search(
     Returns:
         Combined search results from all sources
     """
-    all_results = []
+    # Every source is searched with the same query, so embed it only once
+    query_embedding = create_embedding(query)
     
-    for source_id in source_ids:
+    def search_source(source_id: str) -> List[Dict[str, Any]]:
         source_filter = {"source_id": source_id}
         print(f"   🎯 Querying source: {source_id}")
         
@@ -390,7 +397,8 @@ def execute_multi_source_search(
                 client=supabase_client,
                 query=query,
                 match_count=match_count,
-                filter_metadata=source_filter
+                filter_metadata=source_filter,
+                query_embedding=query_embedding
             )
             
             # Keyword search for this source
@@ -414,11 +422,25 @@ def execute_multi_source_search(
                 client=supabase_client,
                 query=query,
                 match_count=match_count,
-                filter_metadata=source_filter
+                filter_metadata=source_filter,
+                query_embedding=query_embedding
             )
         
-        all_results.extend(source_results)
         print(f"      ✅ Found {len(source_results)} results from {source_id}")
+        return source_results
+    
+    # The per-source searches are independent network calls, so issue them
+    # concurrently instead of paying each round trip in turn
+    if len(source_ids) == 1:
+        per_source_results = [search_source(source_ids[0])]
+    else:
+        max_workers = min(MAX_CONCURRENT_SOURCE_SEARCHES, len(source_ids))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            per_source_results = list(executor.map(search_source, source_ids))
+    
+    all_results = []
+    for source_results in per_source_results:
+        all_results.extend(source_results)
     
     # Sort all results by similarity and take top results
     all_results.sort(key=lambda x: x.get('similarity', 0), reverse=True)
@@ -526,25 +548,27 @@ def smart_chunk_markdown(text: str, chunk_size: int = 5000) -> List[str]:
             chunks.append(text[start:].strip())
             break
 
+        # Break points are searched within text[start:end] by offset, so the
+        # window is never copied out of the text
+        min_break = chunk_size * 0.3
+
         # Try to find a code block boundary first (```)
-        chunk = text[start:end]
-        code_block = chunk.rfind('```')
-        if code_block != -1 and code_block > chunk_size * 0.3:
-            end = start + code_block
-
-        # If no code block, try to break at a paragraph
-        elif '\n\n' in chunk:
-            # Find the last paragraph break
-            last_break = chunk.rfind('\n\n')
-            if last_break > chunk_size * 0.3:  # Only break if we're past 30% of chunk_size
-                end = start + last_break
-
-        # If no paragraph break, try to break at a sentence
-        elif '. ' in chunk:
-            # Find the last sentence break
-            last_period = chunk.rfind('. ')
-            if last_period > chunk_size * 0.3:  # Only break if we're past 30% of chunk_size
-                end = start + last_period + 1
+        code_block = text.rfind('```', start, end)
+        if code_block != -1 and code_block - start > min_break:
+            end = code_block
+
+        else:
+            # If no code block, try to break at the last paragraph
+            last_break = text.rfind('\n\n', start, end)
+            if last_break != -1:
+                if last_break - start > min_break:  # Only break if we're past 30% of chunk_size
+                    end = last_break
+
+            # If no paragraph break, try to break at the last sentence
+            else:
+                last_period = text.rfind('. ', start, end)
+                if last_period != -1 and last_period - start > min_break:
+                    end = last_period + 1
 
         # Extract chunk and clean it up
         chunk = text[start:end].strip()
@@ -556,6 +580,9 @@ def smart_chunk_markdown(text: str, chunk_size: int = 5000) -> List[str]:
 
     return chunks
 
+# Markdown ATX headers, matched line by line
+HEADER_PATTERN = re.compile(r'^(#+)\s+(.+)$', re.MULTILINE)
+
 def extract_section_info(chunk: str) -> Dict[str, Any]:
     """
     Extracts headers and stats from a chunk.
@@ -566,8 +593,8 @@ def extract_section_info(chunk: str) -> Dict[str, Any]:
     Returns:
         Dictionary with headers and stats
     """
-    headers = re.findall(r'^(#+)\s+(.+)$', chunk, re.MULTILINE)
-    header_str = '; '.join([f'{h[0]} {h[1]}' for h in headers]) if headers else ''
+    headers = HEADER_PATTERN.findall(chunk)
+    header_str = '; '.join(f'{level} {title}' for level, title in headers)
 
     return {
         "headers": header_str,
@@ -660,17 +687,19 @@ async def crawl_single_page(ctx: Context, url: str, disable_javascript: bool = N
             metadatas = []
             total_word_count = 0
             
+            # Per-page values are the same for every chunk, so fill those columns in bulk
+            urls.extend([url] * len(chunks))
+            chunk_numbers.extend(range(len(chunks)))
+            contents.extend(chunks)
+            crawl_time = str(asyncio.current_task().get_coro().__name__)
+            
             for i, chunk in enumerate(chunks):
-                urls.append(url)
-                chunk_numbers.append(i)
-                contents.append(chunk)
-                
                 # Extract metadata
                 meta = extract_section_info(chunk)
                 meta["chunk_index"] = i
                 meta["url"] = url
                 meta["source"] = source_id
-                meta["crawl_time"] = str(asyncio.current_task().get_coro().__name__)
+                meta["crawl_time"] = crawl_time
                 metadatas.append(meta)
                 
                 # Accumulate word count
@@ -837,6 +866,7 @@ async def smart_crawl_url(ctx: Context, url: str, max_depth: int = 3, max_concur
         # Track sources and their content
         source_content_map = {}
         source_word_counts = {}
+        crawl_time = str(asyncio.current_task().get_coro().__name__)
         
         # Process documentation chunks
         for doc in crawl_results:
@@ -853,24 +883,24 @@ async def smart_crawl_url(ctx: Context, url: str, max_depth: int = 3, max_concur
                 source_content_map[source_id] = md[:5000]  # Store first 5000 chars
                 source_word_counts[source_id] = 0
             
+            # Per-document values are the same for every chunk, so fill those columns in bulk
+            urls.extend([source_url] * len(chunks))
+            chunk_numbers.extend(range(len(chunks)))
+            contents.extend(chunks)
+            chunk_count += len(chunks)
+            
             for i, chunk in enumerate(chunks):
-                urls.append(source_url)
-                chunk_numbers.append(i)
-                contents.append(chunk)
-                
                 # Extract metadata
                 meta = extract_section_info(chunk)
                 meta["chunk_index"] = i
                 meta["url"] = source_url
                 meta["source"] = source_id
                 meta["crawl_type"] = crawl_type
-                meta["crawl_time"] = str(asyncio.current_task().get_coro().__name__)
+                meta["crawl_time"] = crawl_time
                 metadatas.append(meta)
                 
                 # Accumulate word count
                 source_word_counts[source_id] += meta.get("word_count", 0)
-                
-                chunk_count += 1
         
         # Create url_to_full_document mapping
         url_to_full_document = {}
@@ -878,17 +908,20 @@ async def smart_crawl_url(ctx: Context, url: str, max_depth: int = 3, max_concur
             url_to_full_document[doc['url']] = doc['markdown']
         
         # Update source information for each unique source FIRST (before inserting documents)
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            source_summary_args = [(source_id, content) for source_id, content in source_content_map.items()]
-            source_summaries = list(executor.map(lambda args: extract_source_summary(args[0], args[1]), source_summary_args))
+        source_summary_args = [(source_id, content) for source_id, content in source_content_map.items()]
+        if len(source_summary_args) == 1:
+            # Most crawls hit a single source; skip the thread pool for it
+            source_summaries = [extract_source_summary(*source_summary_args[0])]
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+                source_summaries = list(executor.map(lambda args: extract_source_summary(args[0], args[1]), source_summary_args))
         
         for (source_id, _), summary in zip(source_summary_args, source_summaries):
             word_count = source_word_counts.get(source_id, 0)
             update_source_info(supabase_client, source_id, summary, word_count)
         
         # Add documentation chunks to Supabase (AFTER sources exist)
-        batch_size = 20
-        add_documents_to_supabase(supabase_client, urls, chunk_numbers, contents, metadatas, url_to_full_document, batch_size=batch_size)
+        add_documents_to_supabase(supabase_client, urls, chunk_numbers, contents, metadatas, url_to_full_document)
         
         # Extract and process code examples from all documents only if enabled
         code_examples = []
@@ -903,40 +936,42 @@ async def smart_crawl_url(ctx: Context, url: str, max_depth: int = 3, max_concur
             
             # Extract code blocks from all documents
             for doc in crawl_results:
-                source_url = doc['url']
-                md = doc['markdown']
-                code_blocks = extract_code_blocks(md)
-                
+                code_blocks = extract_code_blocks(doc['markdown'])
                 if code_blocks:
-                    # Process code examples in parallel
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                        # Prepare arguments for parallel processing
-                        summary_args = [(block['code'], block['context_before'], block['context_after']) 
-                                        for block in code_blocks]
-                        
-                        # Generate summaries in parallel
-                        summaries = list(executor.map(process_code_example, summary_args))
-                    
-                    # Prepare code example data
-                    parsed_url = urlparse(source_url)
-                    source_id = parsed_url.netloc or parsed_url.path
-                    
-                    for i, (block, summary) in enumerate(zip(code_blocks, summaries)):
-                        code_urls.append(source_url)
-                        code_chunk_numbers.append(len(code_examples))  # Use global code example index
-                        code_examples.append(block['code'])
-                        code_summaries.append(summary)
-                        
-                        # Create metadata for code example
-                        code_meta = {
-                            "chunk_index": len(code_examples) - 1,
-                            "url": source_url,
-                            "source": source_id,
-                            "char_count": len(block['code']),
-                            "word_count": len(block['code'].split())
-                        }
-                        code_metadatas.append(code_meta)
+                    all_code_blocks.append((doc['url'], code_blocks))
+            
+            # Generate the summaries for every page in one pool, so pages with
+            # only a few code blocks don't each wait on their own round trip
+            summary_args = [(block['code'], block['context_before'], block['context_after'])
+                            for _, code_blocks in all_code_blocks
+                            for block in code_blocks]
+            summaries = []
+            if summary_args:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
+                    summaries = list(executor.map(process_code_example, summary_args))
+            summary_iter = iter(summaries)
             
+            for source_url, code_blocks in all_code_blocks:
+                # Prepare code example data
+                parsed_url = urlparse(source_url)
+                source_id = parsed_url.netloc or parsed_url.path
+                
+                for block, summary in zip(code_blocks, summary_iter):
+                    code_urls.append(source_url)
+                    code_chunk_numbers.append(len(code_examples))  # Use global code example index
+                    code_examples.append(block['code'])
+                    code_summaries.append(summary)
+                    
+                    # Create metadata for code example
+                    code_meta = {
+                        "chunk_index": len(code_examples) - 1,
+                        "url": source_url,
+                        "source": source_id,
+                        "char_count": len(block['code']),
+                        "word_count": len(block['code'].split())
+                    }
+                    code_metadatas.append(code_meta)
+        
             # Add all code examples to Supabase
             if code_examples:
                 add_code_examples_to_supabase(
@@ -945,8 +980,7 @@ async def smart_crawl_url(ctx: Context, url: str, max_depth: int = 3, max_concur
                     code_chunk_numbers, 
                     code_examples, 
                     code_summaries, 
-                    code_metadatas,
-                    batch_size=batch_size
+                    code_metadatas
                 )
         
         return json.dumps({
@@ -1124,15 +1158,16 @@ async def perform_rag_query(ctx: Context, query: str, source_type: str = "all",
             source_ids_to_search = ["simics-dml", "simics-python"]
             print(f"🎯 Database filter: simics-dml + simics-python (dual query)")
         elif source_type == "docs":
-            # For docs, get all non-simics sources and query them
-            # Get all available sources first, then filter out simics sources
-            sources_result = supabase_client.from_('sources').select('source_id').execute()
-            if sources_result.data:
-                non_simics_sources = [s['source_id'] for s in sources_result.data 
-                                    if s['source_id'] not in ['simics-dml', 'simics-python']]
-                if non_simics_sources:
-                    source_ids_to_search = non_simics_sources
-                    print(f"🎯 Documentation filter: searching {len(non_simics_sources)} non-simics sources (excludes simics-dml, simics-python)")
+            # This is the only sources lookup; None means it failed and
+            # results are post-filtered instead.
+            try:
+                docs_source_ids = get_docs_source_ids(supabase_client)
+            except Exception as e:
+                print(f"   ❌ Error getting docs sources: {e}, falling back to post-filter")
+                docs_source_ids = None
+            if docs_source_ids:
+                source_ids_to_search = docs_source_ids
+                print(f"🎯 Documentation filter: searching {len(docs_source_ids)} non-simics sources (excludes simics-dml, simics-python)")
         elif source_type == "all":
             print(f"🌐 No filtering: searching all sources")
         else:
@@ -1147,26 +1182,8 @@ async def perform_rag_query(ctx: Context, query: str, source_type: str = "all",
             )
             
         elif source_type == "docs":
-            # Get all non-simics sources from the database
-            print(f"🔄 Getting non-simics sources for docs search...")
-            try:
-                sources_result = supabase_client.from_('sources')\
-                    .select('source_id')\
-                    .not_.in_('source_id', ['simics-dml', 'simics-python'])\
-                    .execute()
-                
-                docs_source_ids = [row['source_id'] for row in sources_result.data] if sources_result.data else []
-                print(f"   📚 Found {len(docs_source_ids)} documentation sources: {docs_source_ids}")
-                
-                if docs_source_ids:
-                    results = execute_multi_source_search(
-                        supabase_client, query, docs_source_ids, match_count, use_hybrid_search
-                    )
-                else:
-                    print(f"   ⚠️  No documentation sources found")
-                    results = []
-            except Exception as e:
-                print(f"   ❌ Error getting docs sources: {e}, falling back to post-filter")
+            # The sources lookup above found no documentation sources, or failed
+            if docs_source_ids is None:
                 # Fallback to post-filtering if source query fails
                 results = search_documents(
                     client=supabase_client,
@@ -1175,6 +1192,9 @@ async def perform_rag_query(ctx: Context, query: str, source_type: str = "all",
                     filter_metadata=None
                 )
                 results = [r for r in results if r.get('source_id') not in ['simics-dml', 'simics-python']][:match_count]
+            else:
+                print(f"   ⚠️  No documentation sources found")
+                results = []
             
         elif use_hybrid_search:
             # Single source or no source filter with hybrid search
@@ -1327,9 +1347,6 @@ async def search_code_examples(ctx: Context, query: str, source_id: str = None,
         if use_hybrid_search:
             # Hybrid search: combine vector and keyword search
             
-            # Import the search function from utils
-            from utils import search_code_examples as search_code_examples_impl
-            
             # 1. Get vector search results (get more to account for filtering)
             vector_results = search_code_examples_impl(
                 client=supabase_client,
@@ -1395,8 +1412,6 @@ async def search_code_examples(ctx: Context, query: str, source_id: str = None,
             
         else:
             # Standard vector search only
-            from utils import search_code_examples as search_code_examples_impl
-            
             results = search_code_examples_impl(
                 client=supabase_client,
                 query=query,
@@ -2192,7 +2207,8 @@ async def crawl_recursive_internal_links(crawler: AsyncWebCrawler, start_urls: L
     results_all = []
 
     for depth in range(max_depth):
-        urls_to_crawl = [normalize_url(url) for url in current_urls if normalize_url(url) not in visited]
+        # current_urls is already normalized, so a set difference drops visited URLs
+        urls_to_crawl = list(current_urls - visited)
         if not urls_to_crawl:
             break
 
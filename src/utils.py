@@ -3,7 +3,9 @@ Utility functions for the Crawl4AI MCP server.
 """
 import os
 import concurrent.futures
-from typing import List, Dict, Any, Optional, Tuple
+from collections import Counter
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Set, Tuple
 import json
 from supabase import create_client, Client
 from urllib.parse import urlparse
@@ -11,12 +13,10 @@ import openai
 import re
 import time
 
-# Import CrossEncoder for reranking (lazy loading)
-try:
+# CrossEncoder pulls in sentence_transformers/torch, which is slow to import;
+# it is imported in get_rerank_model only when reranking is enabled
+if TYPE_CHECKING:
     from sentence_transformers import CrossEncoder
-except ImportError:
-    print("!!! Error in importing CrossEncoder")
-    CrossEncoder = None
 
 # Import Copilot client
 try:
@@ -31,6 +31,32 @@ openai.api_key = os.getenv("OPENAI_API_KEY")
 # Global variable for Qwen embedding model (lazy loading)
 _qwen_embedding_model = None
 
+# Global Supabase client and the (url, key) it was created with (lazy loading)
+_supabase_client = None
+_supabase_client_config = None
+
+# Maximum number of URLs per .in_() delete; the filter is sent in the query
+# string, so very long URL lists must be split to stay under request limits
+DELETE_URL_BATCH_SIZE = 100
+
+# Rows per insert request; embedding batches are buffered up to this size so
+# each write round trip carries several of them
+INSERT_BATCH_SIZE = 100
+
+# Default number of chunks embedded per request (override with EMBEDDING_BATCH_SIZE)
+DEFAULT_EMBEDDING_BATCH_SIZE = 64
+
+# Code example summaries kept in memory; boilerplate snippets repeated across
+# pages produce identical prompts, which then cost a single chat completion
+CODE_SUMMARY_CACHE_SIZE = 1024
+
+# Default seconds a documentation source ID lookup is reused across queries
+# (override with DOCS_SOURCE_IDS_TTL; 0 disables the cache)
+DEFAULT_DOCS_SOURCE_IDS_TTL = 60
+
+# Cached (fetched_at, source_ids) of the documentation sources
+_docs_source_ids_cache = None
+
 def get_qwen_embedding_model():
     """
     Get the Qwen embedding model (lazy loading).
@@ -84,8 +110,8 @@ def create_embeddings_batch_qwen(texts: List[str]) -> List[List[float]]:
     try:
         print(f"Creating embeddings for {len(texts)} texts using Qwen model...")
         embeddings = model.encode(texts, convert_to_numpy=True)
-        # Convert numpy arrays to lists
-        return [embedding.tolist() for embedding in embeddings]
+        # Convert the whole (n, dim) matrix in one call instead of row by row
+        return embeddings.tolist()
     except Exception as e:
         print(f"Error creating Qwen embeddings: {e}")
         return [[0.0] * 1536 for _ in texts]
@@ -103,20 +129,46 @@ def create_embedding_qwen(text: str) -> List[float]:
     embeddings = create_embeddings_batch_qwen([text])
     return embeddings[0] if embeddings else [0.0] * 1536
 
+def serialize_embedding(embedding: List[float]) -> str:
+    """
+    Serialize an embedding as a compact pgvector literal for insertion.
+
+    pgvector stores 32-bit floats, so the 17 significant digits Python
+    prints for each value are wasted on the wire. Seven significant digits
+    keep float32 precision and roughly halve the insert payload.
+
+    Args:
+        embedding: Embedding values
+
+    Returns:
+        pgvector text literal, e.g. "[0.01234568,-0.5]"
+    """
+    return '[' + ','.join([f'{v:.7g}' for v in embedding]) + ']'
+
 def get_supabase_client() -> Client:
     """
     Get a Supabase client with the URL and key from environment variables.
 
+    The client is created once and reused, so repeated calls share the same
+    HTTP session instead of reconnecting. A new client is created if the
+    configured URL or key changes.
+
     Returns:
         Supabase client instance
     """
+    global _supabase_client, _supabase_client_config
+
     url = os.getenv("SUPABASE_URL")
     key = os.getenv("SUPABASE_SERVICE_KEY")
 
     if not url or not key:
         raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in environment variables")
 
-    return create_client(url, key)
+    if _supabase_client is None or _supabase_client_config != (url, key):
+        _supabase_client = create_client(url, key)
+        _supabase_client_config = (url, key)
+
+    return _supabase_client
 
 def create_embeddings_batch(texts: List[str]) -> List[List[float]]:
     """
@@ -380,6 +432,128 @@ def process_chunk_with_context(args):
     url, content, full_document = args
     return generate_contextual_embedding(full_document, content)
 
+def delete_records_for_urls(client: Client, table: str, urls: List[str]) -> None:
+    """
+    Delete all records of the given URLs from a table.
+
+    URLs are deleted server-side in bounded .in_() batches, one request per
+    batch; if a batch fails, its URLs are deleted one by one as a fallback.
+
+    Args:
+        client: Supabase client
+        table: Table name
+        urls: URLs whose records should be deleted (duplicates are ignored)
+    """
+    # Get unique URLs to delete existing records
+    unique_urls = list(set(urls))
+
+    # Delete existing records in bounded batches of URLs
+    for i in range(0, len(unique_urls), DELETE_URL_BATCH_SIZE):
+        url_batch = unique_urls[i:i + DELETE_URL_BATCH_SIZE]
+        try:
+            # Use the .in_() filter to delete all records with matching URLs
+            client.table(table).delete().in_("url", url_batch).execute()
+        except Exception as e:
+            print(f"Batch delete failed: {e}. Trying one-by-one deletion as fallback.")
+            # Fallback: delete records one by one
+            for url in url_batch:
+                try:
+                    client.table(table).delete().eq("url", url).execute()
+                except Exception as inner_e:
+                    print(f"Error deleting record for URL {url}: {inner_e}")
+                    # Continue with the next URL even if one fails
+
+def insert_rows_with_retry(client: Client, table: str, rows: List[Dict[str, Any]], delete_existing: bool = True) -> Set[str]:
+    """
+    Write rows to a table in one request, retrying with exponential backoff.
+
+    If every attempt fails, the rows are written one by one as a last resort.
+
+    Args:
+        client: Supabase client
+        table: Table name
+        rows: Rows to write
+        delete_existing: Whether existing rows were deleted first; if not, rows
+            are upserted on the (url, chunk_number) unique constraint
+
+    Returns:
+        URLs with at least one row that could not be written
+    """
+    def write(data):
+        if delete_existing:
+            # Normal insert (we already deleted existing records)
+            client.table(table).insert(data).execute()
+        else:
+            # Upsert - insert or update on conflict using unique constraint
+            client.table(table).upsert(data, on_conflict="url,chunk_number").execute()
+
+    max_retries = 3
+    retry_delay = 1.0  # Start with 1 second delay
+
+    for retry in range(max_retries):
+        try:
+            write(rows)
+            # Success - nothing failed
+            return set()
+        except Exception as e:
+            if retry < max_retries - 1:
+                print(f"Error inserting batch into Supabase (attempt {retry + 1}/{max_retries}): {e}")
+                print(f"Retrying in {retry_delay} seconds...")
+                time.sleep(retry_delay)
+                retry_delay *= 2  # Exponential backoff
+            else:
+                # Final attempt failed
+                print(f"Failed to insert batch after {max_retries} attempts: {e}")
+                # Optionally, try inserting records one by one as a last resort
+                print("Attempting to insert records individually...")
+                successful_inserts = 0
+                failed_urls = set()
+                for record in rows:
+                    try:
+                        write(record)
+                        successful_inserts += 1
+                    except Exception as individual_error:
+                        print(f"Failed to insert individual record for URL {record['url']}: {individual_error}")
+                        failed_urls.add(record['url'])
+
+                if successful_inserts > 0:
+                    print(f"Successfully inserted {successful_inserts}/{len(rows)} records individually")
+                return failed_urls
+
+def get_embedding_batch_size() -> int:
+    """Return the number of chunks to embed per request, from EMBEDDING_BATCH_SIZE."""
+    try:
+        return max(1, int(os.getenv("EMBEDDING_BATCH_SIZE", str(DEFAULT_EMBEDDING_BATCH_SIZE))))
+    except ValueError:
+        return DEFAULT_EMBEDDING_BATCH_SIZE
+
+def submit_rows_write(
+    executor: concurrent.futures.ThreadPoolExecutor,
+    previous_write: Optional[concurrent.futures.Future],
+    client: Client,
+    table: str,
+    rows: List[Dict[str, Any]],
+    delete_existing: bool = True,
+    failed_urls: Optional[Set[str]] = None
+) -> concurrent.futures.Future:
+    """
+    Start writing rows on the executor once the previous write has finished.
+
+    Keeping at most one write in flight overlaps it with embedding the next
+    batch while bounding how many rows are held in memory.
+
+    Args:
+        failed_urls: If given, receives the URLs the previous write could not store
+
+    Returns:
+        Future for the submitted write
+    """
+    if previous_write is not None:
+        previous_failed_urls = previous_write.result()
+        if failed_urls is not None:
+            failed_urls.update(previous_failed_urls)
+    return executor.submit(insert_rows_with_retry, client, table, rows, delete_existing)
+
 def add_documents_to_supabase(
     client: Client,
     urls: List[str],
@@ -388,8 +562,8 @@ def add_documents_to_supabase(
     metadatas: List[Dict[str, Any]],
     url_to_full_document: Dict[str, str],
     delete_existing: bool = True,
-    batch_size: int = 20
-) -> None:
+    batch_size: Optional[int] = None
+) -> Set[str]:
     """
     Add documents to the Supabase crawled_pages table in batches.
     Deletes existing records with the same URLs before inserting to prevent duplicates.
@@ -401,27 +575,17 @@ def add_documents_to_supabase(
         contents: List of document contents
         metadatas: List of document metadata
         url_to_full_document: Dictionary mapping URLs to their full document content
-        batch_size: Size of each batch for insertion
+        batch_size: Number of chunks embedded per request (defaults to EMBEDDING_BATCH_SIZE)
+
+    Returns:
+        URLs with at least one chunk that could not be written
     """
+    if batch_size is None:
+        batch_size = get_embedding_batch_size()
+
     # Delete existing records only if delete_existing is True
     if delete_existing:
-        # Get unique URLs to delete existing records
-        unique_urls = list(set(urls))
-
-        # Delete existing records for these URLs in a single operation
-        try:
-            if unique_urls:
-                # Use the .in_() filter to delete all records with matching URLs
-                client.table("crawled_pages").delete().in_("url", unique_urls).execute()
-        except Exception as e:
-            print(f"Batch delete failed: {e}. Trying one-by-one deletion as fallback.")
-            # Fallback: delete records one by one
-            for url in unique_urls:
-                try:
-                    client.table("crawled_pages").delete().eq("url", url).execute()
-                except Exception as inner_e:
-                    print(f"Error deleting record for URL {url}: {inner_e}")
-                    # Continue with the next URL even if one fails
+        delete_records_for_urls(client, "crawled_pages", urls)
     else:
         print("Skipping deletion of existing records (--skip-delete enabled)")
 
@@ -429,127 +593,137 @@ def add_documents_to_supabase(
     use_contextual_embeddings = os.getenv("USE_CONTEXTUAL_EMBEDDINGS", "false") == "true"
     print(f"\n\nUse contextual embeddings: {use_contextual_embeddings}\n\n")
 
-    # Process in batches to avoid memory issues
-    for i in range(0, len(contents), batch_size):
-        batch_end = min(i + batch_size, len(contents))
-
-        # Get batch slices
-        batch_urls = urls[i:batch_end]
-        batch_chunk_numbers = chunk_numbers[i:batch_end]
-        batch_contents = contents[i:batch_end]
-        batch_metadatas = metadatas[i:batch_end]
-
-        # Apply contextual embedding to each chunk if MODEL_CHOICE is set
-        if use_contextual_embeddings:
-            # Prepare arguments for parallel processing
-            process_args = []
-            for j, content in enumerate(batch_contents):
-                url = batch_urls[j]
-                full_document = url_to_full_document.get(url, "")
-                process_args.append((url, content, full_document))
-
-            # Process in parallel using ThreadPoolExecutor
-            contextual_contents = [None] * len(batch_contents)
-            with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                # Submit all tasks and collect results
-                future_to_idx = {executor.submit(process_chunk_with_context, arg): idx
-                                for idx, arg in enumerate(process_args)}
-
-                # Process results as they complete
-                for future in concurrent.futures.as_completed(future_to_idx):
-                    idx = future_to_idx[future]
+    # Chunks repeated in this call (license headers, boilerplate shared across
+    # files) are embedded once; only their serialized embeddings are kept.
+    # Contextual contents differ per document, so there is nothing to share then.
+    repeated_contents = set() if use_contextual_embeddings else {
+        content for content, count in Counter(contents).items() if count > 1
+    }
+    shared_embeddings = {}
+
+    # Process in batches to avoid memory issues. Each write runs on a
+    # background thread while the next batch is being embedded.
+    write_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    pending_write = None
+    pending_rows = []
+    failed_urls = set()
+    try:
+        for i in range(0, len(contents), batch_size):
+            batch_end = min(i + batch_size, len(contents))
+
+            # Get batch slices
+            batch_urls = urls[i:batch_end]
+            batch_chunk_numbers = chunk_numbers[i:batch_end]
+            batch_contents = contents[i:batch_end]
+            batch_metadatas = metadatas[i:batch_end]
+
+            # Apply contextual embedding to each chunk if MODEL_CHOICE is set
+            if use_contextual_embeddings:
+                # Prepare arguments for parallel processing
+                process_args = []
+                for j, content in enumerate(batch_contents):
+                    url = batch_urls[j]
+                    full_document = url_to_full_document.get(url, "")
+                    process_args.append((url, content, full_document))
+
+                contextual_contents = [None] * len(batch_contents)
+                if len(process_args) == 1:
+                    # A single chunk gains nothing from a thread pool; run it inline
                     try:
-                        result, success = future.result()
-                        contextual_contents[idx] = result
+                        result, success = process_chunk_with_context(process_args[0])
+                        contextual_contents[0] = result
                         if success:
-                            batch_metadatas[idx]["contextual_embedding"] = True
+                            batch_metadatas[0]["contextual_embedding"] = True
                     except Exception as e:
-                        print(f"Error processing chunk {idx}: {e}")
-                        # Use original content as fallback
-                        contextual_contents[idx] = batch_contents[idx]
-
-            # Ensure all positions are filled; fall back to original content where needed
+                        print(f"Error processing chunk 0: {e}")
+                        contextual_contents[0] = batch_contents[0]
+                else:
+                    # Process in parallel using ThreadPoolExecutor
+                    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
+                        # Submit all tasks and collect results
+                        future_to_idx = {executor.submit(process_chunk_with_context, arg): idx
+                                        for idx, arg in enumerate(process_args)}
+
+                        # Process results as they complete
+                        for future in concurrent.futures.as_completed(future_to_idx):
+                            idx = future_to_idx[future]
+                            try:
+                                result, success = future.result()
+                                contextual_contents[idx] = result
+                                if success:
+                                    batch_metadatas[idx]["contextual_embedding"] = True
+                            except Exception as e:
+                                print(f"Error processing chunk {idx}: {e}")
+                                # Use original content as fallback
+                                contextual_contents[idx] = batch_contents[idx]
+
+                # Ensure all positions are filled; fall back to original content where needed
+                for j in range(len(contextual_contents)):
+                    if contextual_contents[j] is None:
+                        contextual_contents[j] = batch_contents[j]
+            else:
+                # If not using contextual embeddings, use original contents
+                contextual_contents = batch_contents
+
+            # Create embeddings for the entire batch at once, embedding each
+            # distinct text only once
+            new_texts = list(dict.fromkeys(
+                text for text in contextual_contents if text not in shared_embeddings
+            ))
+            new_embeddings = dict(zip(new_texts, map(serialize_embedding, create_embeddings_batch(new_texts))))
+            for text in new_texts:
+                if text in repeated_contents:
+                    shared_embeddings[text] = new_embeddings[text]
+
+            batch_data = []
             for j in range(len(contextual_contents)):
-                if contextual_contents[j] is None:
-                    contextual_contents[j] = batch_contents[j]
-        else:
-            # If not using contextual embeddings, use original contents
-            contextual_contents = batch_contents
-
-        # Create embeddings for the entire batch at once
-        batch_embeddings = create_embeddings_batch(contextual_contents)
-
-        batch_data = []
-        for j in range(len(contextual_contents)):
-            # Extract metadata fields
-            chunk_size = len(contextual_contents[j])
-
-            # Use source_id from metadata if available, otherwise extract from URL
-            source_id = batch_metadatas[j].get("source_id")
-            if not source_id:
-                parsed_url = urlparse(batch_urls[j])
-                source_id = parsed_url.netloc or parsed_url.path
-
-            # Prepare data for insertion
-            data = {
-                "url": batch_urls[j],
-                "chunk_number": batch_chunk_numbers[j],
-                "content": contextual_contents[j],  # Store original content
-                "metadata": {
-                    "chunk_size": chunk_size,
-                    **batch_metadatas[j]
-                },
-                "source_id": source_id,  # Add source_id field
-                "embedding": batch_embeddings[j]  # Use embedding from contextual content
-            }
+                # Extract metadata fields
+                chunk_size = len(contextual_contents[j])
+
+                # Use source_id from metadata if available, otherwise extract from URL
+                source_id = batch_metadatas[j].get("source_id")
+                if not source_id:
+                    parsed_url = urlparse(batch_urls[j])
+                    source_id = parsed_url.netloc or parsed_url.path
+
+                # Prepare data for insertion
+                data = {
+                    "url": batch_urls[j],
+                    "chunk_number": batch_chunk_numbers[j],
+                    "content": contextual_contents[j],  # Store original content
+                    "metadata": {
+                        "chunk_size": chunk_size,
+                        **batch_metadatas[j]
+                    },
+                    "source_id": source_id,  # Add source_id field
+                    "embedding": new_embeddings.get(contextual_contents[j]) or shared_embeddings[contextual_contents[j]]  # Use embedding from contextual content
+                }
 
-            batch_data.append(data)
+                batch_data.append(data)
 
-        # Insert batch into Supabase with retry logic
-        max_retries = 3
-        retry_delay = 1.0  # Start with 1 second delay
+            # Buffer rows so several embedding batches go out in one request
+            pending_rows.extend(batch_data)
+            if len(pending_rows) >= INSERT_BATCH_SIZE:
+                pending_write = submit_rows_write(write_executor, pending_write, client, "crawled_pages", pending_rows, delete_existing, failed_urls)
+                pending_rows = []
 
-        for retry in range(max_retries):
-            try:
-                if delete_existing:
-                    # Normal insert (we already deleted existing records)
-                    client.table("crawled_pages").insert(batch_data).execute()
-                else:
-                    # Upsert - insert or update on conflict using unique constraint
-                    # Use on_conflict parameter to specify which columns to use for conflict resolution
-                    client.table("crawled_pages").upsert(batch_data, on_conflict="url,chunk_number").execute()
-                # Success - break out of retry loop
-                break
-            except Exception as e:
-                if retry < max_retries - 1:
-                    print(f"Error inserting batch into Supabase (attempt {retry + 1}/{max_retries}): {e}")
-                    print(f"Retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # Exponential backoff
-                else:
-                    # Final attempt failed
-                    print(f"Failed to insert batch after {max_retries} attempts: {e}")
-                    # Optionally, try inserting records one by one as a last resort
-                    print("Attempting to insert records individually...")
-                    successful_inserts = 0
-                    for record in batch_data:
-                        try:
-                            if delete_existing:
-                                client.table("crawled_pages").insert(record).execute()
-                            else:
-                                client.table("crawled_pages").upsert(record, on_conflict="url,chunk_number").execute()
-                            successful_inserts += 1
-                        except Exception as individual_error:
-                            print(f"Failed to insert individual record for URL {record['url']}: {individual_error}")
-
-                    if successful_inserts > 0:
-                        print(f"Successfully inserted {successful_inserts}/{len(batch_data)} records individually")
+        if pending_rows:
+            pending_write = submit_rows_write(write_executor, pending_write, client, "crawled_pages", pending_rows, delete_existing, failed_urls)
+    finally:
+        # Wait for the last write even if embedding failed, and raise its
+        # error rather than losing it with the worker thread
+        write_executor.shutdown(wait=True)
+        if pending_write is not None:
+            failed_urls.update(pending_write.result())
+
+    return failed_urls
 
 def search_documents(
     client: Client,
     query: str,
     match_count: int = 10,
-    filter_metadata: Optional[Dict[str, Any]] = None
+    filter_metadata: Optional[Dict[str, Any]] = None,
+    query_embedding: Optional[List[float]] = None
 ) -> List[Dict[str, Any]]:
     """
     Search for documents in Supabase using vector similarity.
@@ -559,12 +733,15 @@ def search_documents(
         query: Query text
         match_count: Maximum number of results to return
         filter_metadata: Optional metadata filter
+        query_embedding: Precomputed embedding of the query, e.g. when the same
+            query is searched in several sources; created from query if omitted
 
     Returns:
         List of matching documents
     """
     # Create embedding for the query
-    query_embedding = create_embedding(query)
+    if query_embedding is None:
+        query_embedding = create_embedding(query)
 
     # Execute the search using the match_crawled_pages function
     try:
@@ -586,6 +763,9 @@ def search_documents(
         return []
 
 
+# Whitespace at the start of a document
+LEADING_WHITESPACE_PATTERN = re.compile(r'\s*')
+
 def extract_code_blocks(markdown_content: str, min_length: int = 1000) -> List[Dict[str, Any]]:
     """
     Extract code blocks from markdown content along with context.
@@ -599,10 +779,10 @@ def extract_code_blocks(markdown_content: str, min_length: int = 1000) -> List[D
     """
     code_blocks = []
 
-    # Skip if content starts with triple backticks (edge case for files wrapped in backticks)
-    content = markdown_content.strip()
+    # Skip if content starts with triple backticks (edge case for files wrapped in backticks).
+    # Measure the leading whitespace instead of stripping a copy of the whole document.
     start_offset = 0
-    if content.startswith('```'):
+    if markdown_content.startswith('```', LEADING_WHITESPACE_PATTERN.match(markdown_content).end()):
         # Skip the first triple backticks
         start_offset = 3
         print("Skipping initial triple backticks")
@@ -623,6 +803,12 @@ def extract_code_blocks(markdown_content: str, min_length: int = 1000) -> List[D
         start_pos = backtick_positions[i]
         end_pos = backtick_positions[i + 1]
 
+        # A block shorter than min_length before stripping cannot qualify;
+        # skip it without copying its text
+        if end_pos - start_pos - 3 < min_length:
+            i += 2
+            continue
+
         # Extract the content between backticks
         code_section = markdown_content[start_pos+3:end_pos]
 
@@ -699,23 +885,40 @@ Based on the code example and its surrounding context, provide a concise summary
 """
 
     try:
-        response = create_chat_completion(
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that provides concise code example summaries."},
-                {"role": "user", "content": prompt}
-            ],
-            model=model_choice,
-            temperature=0.3,
-            max_tokens=100
-        )
-
-        return response["choices"][0]["message"]["content"].strip()
-
+        return _summarize_code_prompt(prompt, model_choice)
     except Exception as e:
         print(f"Error generating code example summary: {e}")
         return "Code example for demonstration purposes."
 
 
+@lru_cache(maxsize=CODE_SUMMARY_CACHE_SIZE)
+def _summarize_code_prompt(prompt: str, model_choice: Optional[str]) -> str:
+    """
+    Request a code example summary, memoized on the exact prompt.
+
+    Failures raise and are therefore never cached; the caller substitutes
+    its fallback summary.
+
+    Args:
+        prompt: The fully rendered summary prompt
+        model_choice: Chat model to use
+
+    Returns:
+        The summary text
+    """
+    response = create_chat_completion(
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant that provides concise code example summaries."},
+            {"role": "user", "content": prompt}
+        ],
+        model=model_choice,
+        temperature=0.3,
+        max_tokens=100
+    )
+
+    return response["choices"][0]["message"]["content"].strip()
+
+
 def add_code_examples_to_supabase(
     client: Client,
     urls: List[str],
@@ -724,8 +927,8 @@ def add_code_examples_to_supabase(
     summaries: List[str],
     metadatas: List[Dict[str, Any]],
     delete_existing: bool = True,
-    batch_size: int = 20
-):
+    batch_size: Optional[int] = None
+) -> Set[str]:
     """
     Add code examples to the Supabase code_examples table in batches.
 
@@ -736,107 +939,98 @@ def add_code_examples_to_supabase(
         code_examples: List of code example contents
         summaries: List of code example summaries
         metadatas: List of metadata dictionaries
-        batch_size: Size of each batch for insertion
+        batch_size: Number of chunks embedded per request (defaults to EMBEDDING_BATCH_SIZE)
+
+    Returns:
+        URLs with at least one code example that could not be written
     """
     if not urls:
-        return
+        return set()
+
+    if batch_size is None:
+        batch_size = get_embedding_batch_size()
 
     # Delete existing records for these URLs only if delete_existing is True
     if delete_existing:
-        unique_urls = list(set(urls))
-        for url in unique_urls:
-            try:
-                client.table('code_examples').delete().eq('url', url).execute()
-            except Exception as e:
-                print(f"Error deleting existing code examples for {url}: {e}")
+        delete_records_for_urls(client, 'code_examples', urls)
     else:
         print("Skipping deletion of existing code examples (--skip-delete enabled)")
 
     # Process in batches
     total_items = len(urls)
-    for i in range(0, total_items, batch_size):
-        batch_end = min(i + batch_size, total_items)
-        batch_texts = []
-
-        # Create combined texts for embedding (code + summary)
-        for j in range(i, batch_end):
-            combined_text = f"{code_examples[j]}\n\nSummary: {summaries[j]}"
-            batch_texts.append(combined_text)
-
-        # Create embeddings for the batch
-        embeddings = create_embeddings_batch(batch_texts)
-
-        # Check if embeddings are valid (not all zeros)
-        valid_embeddings = []
-        for embedding in embeddings:
-            if embedding and not all(v == 0.0 for v in embedding):
-                valid_embeddings.append(embedding)
-            else:
-                print(f"Warning: Zero or invalid embedding detected, creating new one...")
-                # Try to create a single embedding as fallback
-                single_embedding = create_embedding(batch_texts[len(valid_embeddings)])
-                valid_embeddings.append(single_embedding)
-
-        # Prepare batch data
-        batch_data = []
-        for j, embedding in enumerate(valid_embeddings):
-            idx = i + j
-
-            # Use source_id from metadata if available, otherwise extract from URL
-            source_id = metadatas[idx].get("source_id")
-            if not source_id:
-                parsed_url = urlparse(urls[idx])
-                source_id = parsed_url.netloc or parsed_url.path
-
-            batch_data.append({
-                'url': urls[idx],
-                'chunk_number': chunk_numbers[idx],
-                'content': code_examples[idx],
-                'summary': summaries[idx],
-                'metadata': metadatas[idx],  # Store as JSON object, not string
-                'source_id': source_id,
-                'embedding': embedding
-            })
 
-        # Insert batch into Supabase with retry logic
-        max_retries = 3
-        retry_delay = 1.0  # Start with 1 second delay
+    # Create combined texts for embedding (code + summary)
+    combined_texts = [
+        f"{code}\n\nSummary: {summary}" for code, summary in zip(code_examples, summaries)
+    ]
 
-        for retry in range(max_retries):
-            try:
-                if delete_existing:
-                    # Normal insert (we already deleted existing records)
-                    client.table('code_examples').insert(batch_data).execute()
-                else:
-                    # Upsert - insert or update on conflict using unique constraint
-                    client.table('code_examples').upsert(batch_data, on_conflict="url,chunk_number").execute()
-                # Success - break out of retry loop
-                break
-            except Exception as e:
-                if retry < max_retries - 1:
-                    print(f"Error inserting batch into Supabase (attempt {retry + 1}/{max_retries}): {e}")
-                    print(f"Retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # Exponential backoff
-                else:
-                    # Final attempt failed
-                    print(f"Failed to insert batch after {max_retries} attempts: {e}")
-                    # Optionally, try inserting records one by one as a last resort
-                    print("Attempting to insert records individually...")
-                    successful_inserts = 0
-                    for record in batch_data:
-                        try:
-                            if delete_existing:
-                                client.table('code_examples').insert(record).execute()
-                            else:
-                                client.table('code_examples').upsert(record, on_conflict="url,chunk_number").execute()
-                            successful_inserts += 1
-                        except Exception as individual_error:
-                            print(f"Failed to insert individual record for URL {record['url']}: {individual_error}")
-
-                    if successful_inserts > 0:
-                        print(f"Successfully inserted {successful_inserts}/{len(batch_data)} records individually")
-        print(f"Inserted batch {i//batch_size + 1} of {(total_items + batch_size - 1)//batch_size} code examples")
+    # Code examples repeated in this call (e.g. identical files stored under
+    # several URLs) are embedded once; only their serialized embeddings are kept
+    repeated_texts = {text for text, count in Counter(combined_texts).items() if count > 1}
+    shared_embeddings = {}
+
+    write_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    pending_write = None
+    pending_rows = []
+    failed_urls = set()
+    try:
+        for i in range(0, total_items, batch_size):
+            batch_end = min(i + batch_size, total_items)
+            batch_texts = combined_texts[i:batch_end]
+
+            # Create embeddings for the batch, embedding each distinct text only once
+            new_texts = list(dict.fromkeys(
+                text for text in batch_texts if text not in shared_embeddings
+            ))
+            new_embeddings = {}
+            for text, embedding in zip(new_texts, create_embeddings_batch(new_texts)):
+                # Check if the embedding is valid (not empty or all zeros)
+                if not embedding or not any(embedding):
+                    print(f"Warning: Zero or invalid embedding detected, creating new one...")
+                    # Try to create a single embedding as fallback
+                    embedding = create_embedding(text)
+                new_embeddings[text] = serialize_embedding(embedding)
+                if text in repeated_texts:
+                    shared_embeddings[text] = new_embeddings[text]
+
+            # Prepare batch data
+            batch_data = []
+            for j, text in enumerate(batch_texts):
+                idx = i + j
+
+                # Use source_id from metadata if available, otherwise extract from URL
+                source_id = metadatas[idx].get("source_id")
+                if not source_id:
+                    parsed_url = urlparse(urls[idx])
+                    source_id = parsed_url.netloc or parsed_url.path
+
+                batch_data.append({
+                    'url': urls[idx],
+                    'chunk_number': chunk_numbers[idx],
+                    'content': code_examples[idx],
+                    'summary': summaries[idx],
+                    'metadata': metadatas[idx],  # Store as JSON object, not string
+                    'source_id': source_id,
+                    'embedding': new_embeddings.get(text) or shared_embeddings[text]
+                })
+
+            # Buffer rows so several embedding batches go out in one request
+            pending_rows.extend(batch_data)
+            if len(pending_rows) >= INSERT_BATCH_SIZE:
+                pending_write = submit_rows_write(write_executor, pending_write, client, 'code_examples', pending_rows, delete_existing, failed_urls)
+                pending_rows = []
+            print(f"Embedded batch {i//batch_size + 1} of {(total_items + batch_size - 1)//batch_size} code examples")
+
+        if pending_rows:
+            pending_write = submit_rows_write(write_executor, pending_write, client, 'code_examples', pending_rows, delete_existing, failed_urls)
+    finally:
+        # Wait for the last write even if embedding failed, and raise its
+        # error rather than losing it with the worker thread
+        write_executor.shutdown(wait=True)
+        if pending_write is not None:
+            failed_urls.update(pending_write.result())
+
+    return failed_urls
 
 
 def update_source_info(client: Client, source_id: str, summary: str, word_count: int):
@@ -850,26 +1044,68 @@ def update_source_info(client: Client, source_id: str, summary: str, word_count:
         word_count: Total word count for the source
     """
     try:
-        # Try to update existing source
-        result = client.table('sources').update({
+        # Insert or update in a single round trip; on conflict only the
+        # listed columns are overwritten, so created_at is preserved
+        client.table('sources').upsert({
+            'source_id': source_id,
             'summary': summary,
             'total_word_count': word_count,
             'updated_at': 'now()'
-        }).eq('source_id', source_id).execute()
-
-        # If no rows were updated, insert new source
-        if not result.data:
-            client.table('sources').insert({
-                'source_id': source_id,
-                'summary': summary,
-                'total_word_count': word_count
-            }).execute()
-            print(f"Created new source: {source_id}")
-        else:
-            print(f"Updated source: {source_id}")
+        }, on_conflict='source_id').execute()
+        print(f"Upserted source: {source_id}")
 
     except Exception as e:
         print(f"Error updating source {source_id}: {e}")
+    finally:
+        invalidate_docs_source_ids()
+
+
+def get_docs_source_ids_ttl() -> float:
+    """Return how many seconds documentation source IDs are cached, from DOCS_SOURCE_IDS_TTL."""
+    try:
+        return max(0.0, float(os.getenv("DOCS_SOURCE_IDS_TTL", str(DEFAULT_DOCS_SOURCE_IDS_TTL))))
+    except ValueError:
+        return DEFAULT_DOCS_SOURCE_IDS_TTL
+
+
+def get_docs_source_ids(client: Client) -> List[str]:
+    """
+    Get the IDs of all documentation (non-simics) sources.
+
+    The database excludes the simics sources so only documentation source
+    IDs come back over the wire. The result is reused for
+    get_docs_source_ids_ttl() seconds, so a run of docs queries makes one
+    sources lookup instead of one per query.
+
+    update_source_info invalidates the cache, so sources written in this
+    process show up at once. The crawl scripts run in their own processes
+    and cannot reach it; sources they write show up after at most the TTL.
+
+    Args:
+        client: Supabase client
+
+    Returns:
+        List of documentation source IDs
+    """
+    global _docs_source_ids_cache
+
+    now = time.monotonic()
+    if _docs_source_ids_cache and now - _docs_source_ids_cache[0] < get_docs_source_ids_ttl():
+        return list(_docs_source_ids_cache[1])
+
+    sources_result = client.from_('sources')\
+        .select('source_id')\
+        .not_.in_('source_id', ['simics-dml', 'simics-python'])\
+        .execute()
+    docs_source_ids = [row['source_id'] for row in sources_result.data] if sources_result.data else []
+    _docs_source_ids_cache = (now, docs_source_ids)
+    return list(docs_source_ids)
+
+
+def invalidate_docs_source_ids():
+    """Forget the cached documentation source IDs after the sources table changes."""
+    global _docs_source_ids_cache
+    _docs_source_ids_cache = None
 
 
 def extract_source_summary(source_id: str, content: str, max_length: int = 500) -> str:
@@ -988,6 +1224,12 @@ def get_rerank_model():
     reranking_model = None
     reranking_model_name = None
     if os.getenv("USE_RERANKING", "false") == "true":
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError:
+            print("!!! Error in importing CrossEncoder")
+            return None
+
         # Check which reranker model to use
         use_qwen_reranker = os.getenv("USE_QWEN_RERANKER", "false").lower() == "true"
 
@@ -1103,6 +1345,9 @@ def execute_multi_source_search(
     """
     all_results = []
 
+    # Every source is searched with the same query, so embed it only once
+    query_embedding = create_embedding(query)
+
     for source_id in source_ids:
         source_filter = {"source_id": source_id}
         print(f"   🎯 Querying source: {source_id}")
@@ -1113,7 +1358,8 @@ def execute_multi_source_search(
                 client=supabase_client,
                 query=query,
                 match_count=match_count,
-                filter_metadata=source_filter
+                filter_metadata=source_filter,
+                query_embedding=query_embedding
             )
 
             # Keyword search for this source
@@ -1134,7 +1380,8 @@ def execute_multi_source_search(
                 client=supabase_client,
                 query=query,
                 match_count=match_count,
-                filter_metadata=source_filter
+                filter_metadata=source_filter,
+                query_embedding=query_embedding
             )
 
         all_results.extend(source_results)
@@ -1147,7 +1394,7 @@ def execute_multi_source_search(
 
     return final_results
 
-def rerank_results(model: CrossEncoder, query: str, results: List[Dict[str, Any]], content_key: str = "content") -> List[Dict[str, Any]]:
+def rerank_results(model: "CrossEncoder", query: str, results: List[Dict[str, Any]], content_key: str = "content") -> List[Dict[str, Any]]:
     """
     Rerank search results using a cross-encoder model.
 
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Tests for the Simics source crawler's incremental mode, hash cache and git helpers.
+
+The database upload is replaced by an in-memory store keyed by file URL, so
+these tests run without Supabase or an embedding provider. Tests that need
+the server modules are skipped when their dependencies are not installed.
+"""
+
+import asyncio
+import hashlib
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add scripts directory to Python path
+project_root = Path(__file__).parent.parent
+scripts_path = project_root / "scripts"
+sys.path.insert(0, str(scripts_path))
+sys.path.insert(0, str(project_root / "src"))
+
+import crawl_simics_source
+
+
+@pytest.fixture
+def fake_database(monkeypatch):
+    """Replace the Supabase upload with a dict of file URL -> stored content."""
+    database = {}
+
+    async def add_source_files_to_supabase(processed_files, simics_base_path, delete_existing=True):
+        if delete_existing:
+            database.clear()
+        for file_data in processed_files:
+            url = crawl_simics_source.get_github_url_for_file(file_data['file_path'], simics_base_path)
+            database[url] = file_data['content']
+        return [file_data['file_path'] for file_data in processed_files]
+
+    def get_database_state():
+        return {'url': "https://fake.supabase.co", 'rows': {'simics-dml': len(database)}}
+
+    monkeypatch.setattr(crawl_simics_source, "add_source_files_to_supabase", add_source_files_to_supabase)
+    monkeypatch.setattr(crawl_simics_source, "get_database_state", get_database_state)
+    return database
+
+
+@pytest.fixture
+def simics_tree(tmp_path, monkeypatch):
+    """A Simics package tree with two byte-identical DML files."""
+    simics_path = tmp_path / "simics"
+    for package in ("a", "b"):
+        (simics_path / "pkg" / package).mkdir(parents=True)
+        (simics_path / "pkg" / package / "x.dml").write_text("dml 1.4;\ndevice x;\n")
+    monkeypatch.setenv("SIMICS_SOURCE_PATH", str(simics_path))
+    monkeypatch.setenv("CONTENT_HASH_ALGORITHM", "sha256")
+    monkeypatch.setenv("SIMICS_PARALLEL_WORKERS", "1")
+    return simics_path
+
+
+def test_incremental_run_keeps_identical_copies(simics_tree, fake_database, tmp_path):
+    """Editing one of two identical files must not drop the other one from the store."""
+    output_dir = str(tmp_path / "output")
+    a_path = str(simics_tree / "pkg" / "a" / "x.dml")
+    b_path = str(simics_tree / "pkg" / "b" / "x.dml")
+    a_url = crawl_simics_source.get_github_url_for_file(a_path, str(simics_tree))
+    b_url = crawl_simics_source.get_github_url_for_file(b_path, str(simics_tree))
+
+    # Run 1: full crawl stores both copies under their own URLs
+    assert asyncio.run(crawl_simics_source.crawl_simics_source(True, output_dir))
+    assert fake_database == {a_url: "dml 1.4;\ndevice x;\n", b_url: "dml 1.4;\ndevice x;\n"}
+
+    # Run 2: only a/x.dml changed, so only it is re-stored
+    Path(a_path).write_text("dml 1.4;\ndevice x_changed;\n")
+    assert asyncio.run(crawl_simics_source.crawl_simics_source(False, output_dir))
+    assert fake_database[a_url] == "dml 1.4;\ndevice x_changed;\n"
+    assert fake_database[b_url] == "dml 1.4;\ndevice x;\n"
+
+
+def test_incremental_run_after_database_cleared_stores_all_files(simics_tree, fake_database, tmp_path):
+    """A hash cache saved against records that were since deleted must not skip any file."""
+    output_dir = str(tmp_path / "output")
+
+    assert asyncio.run(crawl_simics_source.crawl_simics_source(True, output_dir))
+    stored = dict(fake_database)
+    assert len(stored) == 2
+
+    # e.g. step 1 of crawl_pipeline.py (delete_all_records.py --confirm)
+    fake_database.clear()
+
+    assert asyncio.run(crawl_simics_source.crawl_simics_source(False, output_dir))
+    assert fake_database == stored
+
+
+def test_hash_cache_round_trip(tmp_path):
+    """A saved cache loads back unchanged for the same algorithm only."""
+    cache_path = str(tmp_path / "output" / crawl_simics_source.HASH_CACHE_FILENAME)
+    hash_cache = {"/simics/pkg/a/x.dml": [1700000000123456789, 20, "abc123"]}
+    database_state = {'url': "https://fake.supabase.co", 'rows': {'simics-dml': 3, 'simics-python': 0}}
+
+    crawl_simics_source.save_hash_cache(cache_path, "sha256", hash_cache, database_state)
+
+    assert crawl_simics_source.load_hash_cache(cache_path, "sha256", database_state) == hash_cache
+    # A cache built with another algorithm cannot be compared against
+    assert crawl_simics_source.load_hash_cache(cache_path, "xxh3", database_state) == {}
+    # Nor one saved against records that have since changed
+    cleared_state = {'url': "https://fake.supabase.co", 'rows': {'simics-dml': 0, 'simics-python': 0}}
+    assert crawl_simics_source.load_hash_cache(cache_path, "sha256", cleared_state) == {}
+
+
+def test_load_hash_cache_ignores_missing_and_unreadable_files(tmp_path):
+    """A missing or corrupt sidecar starts an empty cache instead of failing the crawl."""
+    cache_path = tmp_path / crawl_simics_source.HASH_CACHE_FILENAME
+    assert crawl_simics_source.load_hash_cache(str(cache_path), "sha256") == {}
+
+    cache_path.write_text("{not json")
+    assert crawl_simics_source.load_hash_cache(str(cache_path), "sha256") == {}
+
+
+def test_cached_file_status(tmp_path):
+    """The [mtime_ns, size, hash] entry decides whether a file needs re-reading."""
+    file_path = tmp_path / "x.dml"
+    file_path.write_text("dml 1.4;\n")
+    stat = os.stat(file_path)
+    hash_cache = {str(file_path): [stat.st_mtime_ns, stat.st_size, "abc123"]}
+
+    assert crawl_simics_source.get_cached_file_status(str(file_path), hash_cache) == "unchanged"
+
+    # Same size, new mtime: the content may still be identical
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert crawl_simics_source.get_cached_file_status(str(file_path), hash_cache) == "touched"
+
+    # Different size: the content cannot match
+    file_path.write_text("dml 1.4;\ndevice x;\n")
+    assert crawl_simics_source.get_cached_file_status(str(file_path), hash_cache) == "changed"
+
+    assert crawl_simics_source.get_cached_file_status(str(tmp_path / "new.dml"), hash_cache) == "changed"
+
+
+def test_get_file_hash_reuses_cached_hash_until_stat_changes(tmp_path):
+    """An unchanged stat returns the cached hash; a changed one re-hashes and updates the entry."""
+    file_path = tmp_path / "x.dml"
+    file_path.write_text("dml 1.4;\n")
+    stat = os.stat(file_path)
+    hash_cache = {str(file_path): [stat.st_mtime_ns, stat.st_size, "cached"]}
+
+    assert crawl_simics_source.get_file_hash(str(file_path), "sha256", hash_cache, stat=stat) == "cached"
+
+    file_path.write_text("dml 1.4;\ndevice x;\n")
+    stat = os.stat(file_path)
+    expected = hashlib.sha256(b"dml 1.4;\ndevice x;\n").hexdigest()
+    assert crawl_simics_source.get_file_hash(str(file_path), "sha256", hash_cache, stat=stat) == expected
+    assert hash_cache[str(file_path)] == [stat.st_mtime_ns, stat.st_size, expected]
+
+
+def test_unknown_hash_algorithm_falls_back_to_sha256(monkeypatch):
+    """An unknown CONTENT_HASH_ALGORITHM is recorded and computed as sha256."""
+    monkeypatch.setenv("CONTENT_HASH_ALGORITHM", "blake3")
+
+    assert crawl_simics_source.get_content_hash_algorithm() == "sha256"
+    assert crawl_simics_source.get_hash_digest("blake3") is hashlib.sha256
+
+
+def test_xxh3_falls_back_to_sha256_without_xxhash(monkeypatch, tmp_path):
+    """Without xxhash installed the default algorithm still hashes files."""
+    monkeypatch.delenv("CONTENT_HASH_ALGORITHM", raising=False)
+    monkeypatch.setattr(crawl_simics_source, "xxhash", None)
+    file_path = tmp_path / "x.dml"
+    file_path.write_bytes(b"dml 1.4;\n")
+
+    assert crawl_simics_source.get_content_hash_algorithm() == "sha256"
+    assert crawl_simics_source.calculate_file_hash(str(file_path)) == hashlib.sha256(b"dml 1.4;\n").hexdigest()
+
+
+COMMIT_SHA = "0123456789abcdef0123456789abcdef01234567"
+
+
+def test_read_git_head_detached(tmp_path):
+    (tmp_path / ".git").mkdir()
+    (tmp_path / ".git" / "HEAD").write_text(COMMIT_SHA + "\n")
+    (tmp_path / "pkg").mkdir()
+
+    assert crawl_simics_source.read_git_head(str(tmp_path / "pkg")) == COMMIT_SHA
+
+
+def test_read_git_head_loose_ref(tmp_path):
+    git_dir = tmp_path / ".git"
+    (git_dir / "refs" / "heads").mkdir(parents=True)
+    (git_dir / "HEAD").write_text("ref: refs/heads/main\n")
+    (git_dir / "refs" / "heads" / "main").write_text(COMMIT_SHA + "\n")
+
+    assert crawl_simics_source.read_git_head(str(tmp_path)) == COMMIT_SHA
+
+
+def test_read_git_head_packed_ref(tmp_path):
+    git_dir = tmp_path / ".git"
+    git_dir.mkdir()
+    (git_dir / "HEAD").write_text("ref: refs/heads/main\n")
+    (git_dir / "packed-refs").write_text(
+        "# pack-refs with: peeled fully-peeled sorted\n"
+        f"{'f' * 40} refs/heads/other\n"
+        f"{COMMIT_SHA} refs/heads/main\n"
+    )
+
+    assert crawl_simics_source.read_git_head(str(tmp_path)) == COMMIT_SHA
+
+
+def test_read_git_head_worktree(tmp_path):
+    """A .git file points at a worktree git dir whose refs live in the common dir."""
+    common_dir = tmp_path / "main" / ".git"
+    worktree_git_dir = common_dir / "worktrees" / "wt"
+    worktree_git_dir.mkdir(parents=True)
+    (common_dir / "refs" / "heads").mkdir(parents=True)
+    (common_dir / "refs" / "heads" / "feature").write_text(COMMIT_SHA + "\n")
+    (worktree_git_dir / "HEAD").write_text("ref: refs/heads/feature\n")
+    (worktree_git_dir / "commondir").write_text("../..\n")
+    worktree = tmp_path / "wt"
+    worktree.mkdir()
+    (worktree / ".git").write_text(f"gitdir: {worktree_git_dir}\n")
+
+    assert crawl_simics_source.read_git_head(str(worktree)) == COMMIT_SHA
+
+
+def test_read_git_head_outside_repository(tmp_path, monkeypatch):
+    """Without a resolvable HEAD the caller falls back to running git."""
+    monkeypatch.setattr(crawl_simics_source, "find_git_dir", lambda path: None)
+    assert crawl_simics_source.read_git_head(str(tmp_path)) is None
+
+    monkeypatch.undo()
+    git_dir = tmp_path / ".git"
+    git_dir.mkdir()
+    (git_dir / "HEAD").write_text("ref: refs/heads/missing\n")
+    assert crawl_simics_source.read_git_head(str(tmp_path)) is None
+
+
+def test_identical_copies_are_chunked_once_and_stored_under_each_url(simics_tree, monkeypatch):
+    """Identical files share one chunking pass but each keeps its own URL in the store."""
+    pytest.importorskip("crawl4ai_mcp", exc_type=ImportError)
+    import crawl4ai_mcp
+    import utils
+
+    monkeypatch.setenv("USE_AGENTIC_RAG", "false")
+    stored = {}
+    chunked = []
+
+    def smart_chunk_markdown(text, *args, **kwargs):
+        chunked.append(text)
+        return [text]
+
+    def add_documents_to_supabase(client, urls, chunk_numbers, contents, metadatas, url_to_full_document, delete_existing=True):
+        for url, content in zip(urls, contents):
+            stored.setdefault(url, []).append(content)
+        return set()
+
+    monkeypatch.setattr(crawl4ai_mcp, "smart_chunk_markdown", smart_chunk_markdown)
+    monkeypatch.setattr(utils, "get_supabase_client", lambda: object())
+    monkeypatch.setattr(utils, "update_source_info", lambda *args: None)
+    monkeypatch.setattr(utils, "add_documents_to_supabase", add_documents_to_supabase)
+
+    paths = [str(simics_tree / "pkg" / package / "x.dml") for package in ("a", "b")]
+    processed_files = [crawl_simics_source.process_source_file(path, hash_algorithm="sha256") for path in paths]
+
+    stored_paths = asyncio.run(crawl_simics_source.add_source_files_to_supabase(processed_files, str(simics_tree)))
+
+    assert stored_paths == paths
+    assert chunked == ["dml 1.4;\ndevice x;\n"]
+    assert stored == {
+        crawl_simics_source.get_github_url_for_file(path, str(simics_tree)): ["dml 1.4;\ndevice x;\n"]
+        for path in paths
+    }
+
+
+def test_serialize_embedding():
+    """Embeddings are sent as compact float32-precision pgvector literals."""
+    utils = pytest.importorskip("utils", exc_type=ImportError)
+
+    assert utils.serialize_embedding([0.0123456789, -0.5, 1.0]) == "[0.01234568,-0.5,1]"
+    assert utils.serialize_embedding([]) == "[]"
+
+
+def test_unreadable_touched_file_is_dropped_from_cache(tmp_path, monkeypatch):
+    """A touched file that cannot be re-hashed must count as changed, not unchanged."""
+    file_path = tmp_path / "x.dml"
+    file_path.write_text("dml 1.4;\n")
+    stat = os.stat(file_path)
+    hash_cache = {str(file_path): [stat.st_mtime_ns - 1, stat.st_size, "stale"]}
+
+    def unreadable(file_path, algorithm=None):
+        raise PermissionError(f"Permission denied: '{file_path}'")
+
+    monkeypatch.setattr(crawl_simics_source, "calculate_file_hash_and_stat", unreadable)
+    crawl_simics_source.calculate_file_hashes([str(file_path)], "sha256", hash_cache)
+
+    assert str(file_path) not in hash_cache
+    assert crawl_simics_source.get_cached_file_status(str(file_path), hash_cache) == "changed"
+
+
+def test_unchanged_run_saves_rehashed_and_pruned_cache(simics_tree, fake_database, tmp_path):
+    """A run with nothing to upload still records touched files and forgets deleted ones."""
+    output_dir = str(tmp_path / "output")
+    cache_path = os.path.join(output_dir, crawl_simics_source.HASH_CACHE_FILENAME)
+    a_path = str(simics_tree / "pkg" / "a" / "x.dml")
+    b_path = str(simics_tree / "pkg" / "b" / "x.dml")
+
+    assert asyncio.run(crawl_simics_source.crawl_simics_source(True, output_dir))
+
+    os.remove(a_path)
+    stat = os.stat(b_path)
+    os.utime(b_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert asyncio.run(crawl_simics_source.crawl_simics_source(False, output_dir))
+    hash_cache = crawl_simics_source.load_hash_cache(cache_path, "sha256", crawl_simics_source.get_database_state())
+    assert list(hash_cache) == [b_path]
+    assert hash_cache[b_path][0] == os.stat(b_path).st_mtime_ns